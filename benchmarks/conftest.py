@@ -0,0 +1,224 @@
+# benchmarks/conftest.py
+#
+# Benchmark uchun masshtablangan dataset: main.py modellari asosida vaqtinchalik
+# SQLite faylga yoziladi. Masshtab BENCH_SCALE orqali tanlanadi (tiny, small,
+# medium, full). BENCH_DB berilsa, dataset shu faylda saqlanib qayta ishlatiladi;
+# faylning masshtabi yoki sxemasi mos kelmasa, u qayta yaratiladi. 2024-07-01 dan
+# oldin qaytarilgan transactionlar yillik arxiv jadvallariga ko'chiriladi.
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import closing
+from datetime import date, datetime, timedelta
+
+import httpx
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+import main
+
+# Har bir ota yozuv uchun nechta bola yozuv yaratiladi (har maktabda bitta kutubxonachi)
+SCALES = {
+    "tiny": dict(regions=2, districts=3, schools=2, formulars=3, transactions=11),
+    "small": dict(regions=12, districts=10, schools=10, formulars=3, transactions=11),
+    "medium": dict(regions=12, districts=125, schools=10, formulars=3, transactions=11),
+    # 12 region, 1500 district, 15000 school, 450000 formular, 4950000 transaction
+    "full": dict(regions=12, districts=125, schools=10, formulars=30, transactions=11),
+}
+INSERT_BATCH_SIZE = 10_000
+# Dataset mazmuni o'zgarganda oshiriladi – eski BENCH_DB fayllari qayta yaratiladi
+DATASET_VERSION = 2
+# Shu sanadan oldin qaytarilgan transactionlar arxiv jadvallariga ko'chiriladi (2023 va 2024)
+ARCHIVE_BEFORE = datetime(2024, 7, 1)
+
+
+def _batched(rows, size=INSERT_BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _dataset(scale):
+    """Yield (table, rows) pairs for the requested scale with deterministic ids."""
+    now = datetime(2025, 1, 1)
+    n_regions = scale["regions"]
+    n_districts = n_regions * scale["districts"]
+    n_schools = n_districts * scale["schools"]
+    n_formulars = n_schools * scale["formulars"]
+
+    yield main.Region.__table__, ({"id": i, "name": f"Region {i}"} for i in range(1, n_regions + 1))
+    yield main.District.__table__, (
+        {"id": i, "name": f"District {i}", "region_id": (i - 1) // scale["districts"] + 1}
+        for i in range(1, n_districts + 1)
+    )
+    yield main.School.__table__, (
+        {"id": i, "name": f"School {i}", "district_id": (i - 1) // scale["schools"] + 1}
+        for i in range(1, n_schools + 1)
+    )
+    yield main.Librarian.__table__, (
+        {"id": i, "ism": f"Ism {i}", "familiya": f"Familiya {i}", "telefon_raqam": f"+998{i:09d}", "school_id": i}
+        for i in range(1, n_schools + 1)
+    )
+    yield main.Formular.__table__, (
+        {
+            "id": i,
+            "ism": f"Ism {i}",
+            "familiya": f"Familiya {i}",
+            "tugilgan_sanasi": date(2010, 1, 1) - timedelta(days=i % 20000),
+            "uid": f"formular-{i}",
+            "role": ("oquvchi", "oqituvchi", "boshqa")[i % 3],
+            "school_id": (i - 1) // scale["formulars"] + 1,
+            "manzili": f"Manzil {i}",
+            "telefon_raqam": f"+998{i:09d}",
+            "librarian_id": (i - 1) // scale["formulars"] + 1,
+        }
+        for i in range(1, n_formulars + 1)
+    )
+    # Har bir formular uchun oxirgisidan tashqari barcha transactionlar qaytarilgan
+    per_formular = scale["transactions"]
+    yield main.BookTransaction.__table__, (
+        {
+            "id": i,
+            "formular_id": (i - 1) // per_formular + 1,
+            "kitob_qaytarish_muddati": date(2025, 2, 1),
+            "kitob_olingan_sana": now - timedelta(days=i % 365),
+            "kitob_qaytarilgan_sana": None if i % per_formular == 0 else now - timedelta(days=i % 600),
+            "inventar_raqami": f"INV-{i}",
+            "bolim": "Badiiy",
+            "muallif": f"Muallif {i % 1000}",
+            "kitob_nomi": f"Kitob {i % 5000}",
+            "is_returned": i % per_formular != 0,
+        }
+        for i in range(1, n_formulars * per_formular + 1)
+    )
+
+
+def _bench_meta(scale):
+    """Describe the dataset a benchmark database must hold: its version, scale and a hash of the schema DDL."""
+    dialect = sqlite.dialect()
+    ddl = []
+    for table in main.Base.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(dialect=dialect)))
+        ddl.extend(str(CreateIndex(index).compile(dialect=dialect)) for index in sorted(table.indexes, key=lambda i: i.name))
+    return {
+        "dataset": str(DATASET_VERSION),
+        "scale": json.dumps(scale, sort_keys=True),
+        "schema": hashlib.sha256("\n".join(ddl).encode()).hexdigest(),
+    }
+
+
+def _read_bench_meta(path):
+    with closing(sqlite3.connect(path)) as conn:
+        try:
+            return dict(conn.execute("SELECT key, value FROM bench_meta"))
+        except sqlite3.OperationalError:
+            return None
+
+
+async def _populate(engine, scale):
+    async with engine.begin() as conn:
+        await conn.run_sync(main.Base.metadata.create_all)
+    for table, rows in _dataset(scale):
+        for batch in _batched(rows):
+            async with engine.begin() as conn:
+                await conn.execute(table.insert(), batch)
+    await main.archive_returned_transactions(older_than_days=(datetime.now() - ARCHIVE_BEFORE).days, db_engine=engine)
+    # Meta oxirida yoziladi – to'liq yaratilmagan fayl meta siz qoladi
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE TABLE bench_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"))
+        await conn.execute(
+            text("INSERT INTO bench_meta (key, value) VALUES (:key, :value)"),
+            [{"key": key, "value": value} for key, value in _bench_meta(scale).items()],
+        )
+
+
+@pytest.fixture(scope="session")
+def bench_scale():
+    name = os.environ.get("BENCH_SCALE", "tiny")
+    if name not in SCALES:
+        raise pytest.UsageError(f"BENCH_SCALE must be one of {', '.join(SCALES)}")
+    return SCALES[name]
+
+
+@pytest.fixture(scope="session")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def bench_db_path(tmp_path_factory):
+    return os.environ.get("BENCH_DB") or str(tmp_path_factory.mktemp("bench") / "bench.db")
+
+
+@pytest.fixture(scope="session")
+def bench_engine(loop, bench_scale, bench_db_path):
+    reuse = os.path.exists(bench_db_path)
+    if reuse:
+        meta = _read_bench_meta(bench_db_path)
+        if meta is None:
+            raise pytest.UsageError(
+                f"{bench_db_path} is not a complete benchmark database (no bench_meta table); delete it to rebuild"
+            )
+        if meta != _bench_meta(bench_scale):
+            os.remove(bench_db_path)
+            reuse = False
+    engine = create_async_engine(f"sqlite+aiosqlite:///{bench_db_path}", echo=False)
+    if not reuse:
+        loop.run_until_complete(_populate(engine, bench_scale))
+    yield engine
+    loop.run_until_complete(engine.dispose())
+
+
+@pytest.fixture(scope="session")
+def client(loop, bench_engine):
+    bench_session = sessionmaker(bench_engine, expire_on_commit=False, class_=AsyncSession)
+
+    async def get_bench_db():
+        async with bench_session() as session:
+            yield session
+
+    main.app.dependency_overrides[main.get_db] = get_bench_db
+    main.rate_limiter.enabled = False
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+    yield client
+    loop.run_until_complete(client.aclose())
+    main.app.dependency_overrides.pop(main.get_db, None)
+    main.rate_limiter.enabled = True
+
+
+@pytest.fixture
+def get(loop, client):
+    """Synchronous GET through the in-process ASGI client, bypassing the reference cache."""
+
+    def get(url):
+        main.compression.cache.invalidate()
+        return loop.run_until_complete(client.get(url))
+
+    return get
+
+
+@pytest.fixture
+def captured_sql(bench_engine):
+    """Collect (statement, parameters) for every SQL statement executed during a test."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(bench_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    event.remove(bench_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
@@ -0,0 +1,42 @@
+# benchmarks/endpoints.py
+#
+# Benchmark qilinadigan GET endpointlar va har biri uchun to'liq skanerlanishiga
+# ruxsat berilgan jadvallar. Filtrsiz list endpointlari o'z jadvalini butunlay
+# o'qiydi; qolganlari faqat indeks orqali qidirishi kerak.
+
+ENDPOINTS = [
+    ("regions", "/regions", {"regions"}),
+    ("region", "/regions/1", set()),
+    ("districts", "/districts", {"districts"}),
+    ("region_districts", "/regions/1/districts", set()),
+    ("schools", "/schools", {"schools"}),
+    ("district_schools", "/districts/1/schools", set()),
+    ("librarians", "/librarians", {"librarians"}),
+    ("school_librarians", "/schools/1/librarians", set()),
+    ("librarian", "/librarians/1", set()),
+    ("formulars", "/formulars", {"formulars"}),
+    ("formular", "/formulars/1", set()),
+    ("librarian_formulars", "/librarians/1/formulars", set()),
+    ("school_formulars", "/schools/1/formulars", set()),
+    ("formular_transactions", "/formulars/1/transactions", set()),
+    ("formular_transactions_archived", "/formulars/1/transactions?include_archived=true", {"sqlite_master"}),
+    ("changes", "/changes?since=0", set()),
+    ("school_changes", "/changes?since=0&school_id=1", set()),
+    ("librarian_changes", "/changes?since=0&librarian_id=1", set()),
+]
+
+ENDPOINT_IDS = [name for name, _, _ in ENDPOINTS]
+
+# Eksport joblari: (tur, filtrlar, COUNT so'rovida skanerlanishiga ruxsat berilgan jadval yoki alias nomlari).
+# Filtrsiz eksport qatorlar sonini butun jadvalni o'qib hisoblaydi.
+EXPORTS = [
+    ("formulars", {}, {"formulars"}),
+    ("formulars", {"region_id": 1}, set()),
+    ("formulars", {"school_id": 1}, set()),
+    ("transactions", {}, {"t"}),
+    ("transactions", {"region_id": 1}, set()),
+    ("transactions", {"school_id": 1}, set()),
+    ("loan_stats", {}, set()),
+    ("loan_stats", {"region_id": 1}, set()),
+    ("loan_stats", {"school_id": 1}, set()),
+]
@@ -0,0 +1,12 @@
+import pytest
+
+from benchmarks.endpoints import ENDPOINT_IDS, ENDPOINTS
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.mark.parametrize("name, url", [(name, url) for name, url, _ in ENDPOINTS], ids=ENDPOINT_IDS)
+def test_endpoint(benchmark, get, name, url):
+    benchmark.group = "endpoints"
+    response = benchmark(get, url)
+    assert response.status_code == 200
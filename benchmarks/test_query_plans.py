@@ -0,0 +1,55 @@
+import re
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from benchmarks.endpoints import ENDPOINT_IDS, ENDPOINTS, EXPORTS
+
+# "SCAN formulars" va "SCAN formulars USING COVERING INDEX ..." – ikkalasi ham butun jadval/indeksni o'qiydi;
+# SQLite 3.36 dan oldingi versiyalar "SCAN TABLE formulars" deb chiqaradi
+SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)")
+
+
+def explain(db_path, statement, parameters):
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+    return [row[-1] for row in rows]
+
+
+@pytest.mark.parametrize("name, url, allowed_scans", ENDPOINTS, ids=ENDPOINT_IDS)
+def test_query_plan(get, captured_sql, bench_db_path, name, url, allowed_scans):
+    response = get(url)
+    assert response.status_code == 200
+    assert captured_sql, f"{url} executed no SQL"
+
+    regressions = []
+    for statement, parameters in captured_sql:
+        for detail in explain(bench_db_path, statement, parameters):
+            match = SCAN_RE.match(detail)
+            if match and match.group(1) not in allowed_scans:
+                regressions.append(f"{detail}  <-  {statement}")
+    assert not regressions, f"{url} falls back to a full scan:\n" + "\n".join(regressions)
+
+
+@pytest.mark.parametrize("kind, params, count_scans", EXPORTS, ids=[f"{kind}-{'-'.join(params) or 'all'}" for kind, params, _ in EXPORTS])
+def test_export_query_plan(loop, bench_engine, captured_sql, bench_db_path, tmp_path, monkeypatch, kind, params, count_scans):
+    # Keyset partiyalar na to'liq skanerlash, na butun jadvalni saralash qilmasligi kerak
+    monkeypatch.setattr(main, "engine", bench_engine)
+    job = SimpleNamespace(kind=kind, params=params, rows_done=0, rows_total=None)
+    loop.run_until_complete(main.run_export_job(job, str(tmp_path / "export.csv")))
+    assert job.rows_done > 0
+
+    statements = {statement: parameters for statement, parameters in captured_sql}
+    assert any("booktransactions_archive_" in statement for statement in statements) or kind == "formulars"
+    regressions = []
+    for statement, parameters in statements.items():
+        if "FROM sqlite_master" in statement:
+            continue
+        allowed_scans = count_scans if statement.startswith("SELECT COUNT(*)") else set()
+        for detail in explain(bench_db_path, statement, parameters):
+            match = SCAN_RE.match(detail)
+            if (match and match.group(1) not in allowed_scans) or "TEMP B-TREE FOR ORDER BY" in detail:
+                regressions.append(f"{detail}  <-  {statement}")
+    assert not regressions, f"{kind} export regressed:\n" + "\n".join(regressions)
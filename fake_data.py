@@ -1,13 +1,16 @@
 import asyncio
+from concurrent.futures import ProcessPoolExecutor
 from faker import Faker
 from datetime import date, datetime, timedelta
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import select
-from main import Base, Region, District, School, Librarian, Formular, BookTransaction
+from main import Base, Region, District, School, Librarian, Formular, BookTransaction, SHARD_URLS
+from sharding import init_shard_schema
 
 # Database URL
 DATABASE_URL = "sqlite+aiosqlite:///./test.db"
+REGION_COUNT = 12
 
 # Initialize Faker
 fake = Faker()
@@ -17,16 +20,16 @@ engine = create_async_engine(DATABASE_URL, echo=False)
 async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
 # Function to create fake regions
-async def create_fake_regions():
-    async with async_session() as session:
-        regions = [Region(name=fake.unique.city()) for _ in range(12)]
+async def create_fake_regions(session_factory=async_session, count=REGION_COUNT):
+    async with session_factory() as session:
+        regions = [Region(name=fake.unique.city()) for _ in range(count)]
         session.add_all(regions)
         await session.commit()
-        print("Created 12 regions.")
+        print(f"Created {count} regions.")
 
 # Function to create fake districts
-async def create_fake_districts():
-    async with async_session() as session:
+async def create_fake_districts(session_factory=async_session):
+    async with session_factory() as session:
         regions = (await session.execute(select(Region))).scalars().all()
         districts = []
         for region in regions:
@@ -34,20 +37,20 @@ async def create_fake_districts():
                 districts.append(District(name=fake.unique.city(), region_id=region.id))
         session.add_all(districts)
         await session.commit()
-        print("Created 1500 districts.")
+        print(f"Created {len(districts)} districts.")
 
 # Function to create fake schools
-async def create_fake_schools():
-    async with async_session() as session:
+async def create_fake_schools(session_factory=async_session):
+    async with session_factory() as session:
         districts = (await session.execute(select(District))).scalars().all()
         schools = [School(name=fake.unique.company(), district_id=district.id) for district in districts for _ in range(10)]  # 10 schools per district (1500 × 10 = 15000 schools)
         session.add_all(schools)
         await session.commit()
-        print("Created 15000 schools.")
+        print(f"Created {len(schools)} schools.")
 
 # Function to create fake librarians
-async def create_fake_librarians():
-    async with async_session() as session:
+async def create_fake_librarians(session_factory=async_session):
+    async with session_factory() as session:
         schools = (await session.execute(select(School))).scalars().all()
         librarians = [Librarian(
             ism=fake.first_name(),
@@ -57,11 +60,11 @@ async def create_fake_librarians():
         ) for school in schools]
         session.add_all(librarians)
         await session.commit()
-        print("Created 15000 librarians.")
+        print(f"Created {len(librarians)} librarians.")
 
 # Function to create fake formulars (students, teachers, others)
-async def create_fake_formulars():
-    async with async_session() as session:
+async def create_fake_formulars(session_factory=async_session):
+    async with session_factory() as session:
         librarians = (await session.execute(select(Librarian))).scalars().all()
         formulars = []
         for librarian in librarians:
@@ -108,8 +111,8 @@ async def create_fake_formulars():
         print("Created formulars (students, teachers, others).")
 
 # Function to create fake book transactions
-async def create_fake_book_transactions():
-    async with async_session() as session:
+async def create_fake_book_transactions(session_factory=async_session):
+    async with session_factory() as session:
         formulars = (await session.execute(select(Formular))).scalars().all()
         transactions = []
         for formular in formulars:
@@ -148,6 +151,35 @@ async def main():
     await create_fake_formulars()
     await create_fake_book_transactions()
 
+# Function to populate one shard with its share of regions
+async def populate_shard(url, shard, region_count):
+    shard_engine = create_async_engine(url, echo=False)
+    shard_session = sessionmaker(shard_engine, expire_on_commit=False, class_=AsyncSession)
+    await init_shard_schema(shard_engine, shard, Base.metadata)
+    await create_fake_regions(shard_session, region_count)
+    await create_fake_districts(shard_session)
+    await create_fake_schools(shard_session)
+    await create_fake_librarians(shard_session)
+    await create_fake_formulars(shard_session)
+    await create_fake_book_transactions(shard_session)
+    await shard_engine.dispose()
+
+def populate_shard_process(url, shard, region_count):
+    # Har bir jarayon o'z Faker seed'idan foydalanadi, aks holda fork qilingan jarayonlar bir xil ma'lumot yaratadi
+    fake.seed_instance(shard)
+    asyncio.run(populate_shard(url, shard, region_count))
+
+# Shardlar alohida jarayonlarda parallel to'ldiriladi (SHARD_URLS o'rnatilgan bo'lsa)
+def populate_shards(urls, region_count=REGION_COUNT):
+    counts = [region_count // len(urls) + (1 if shard < region_count % len(urls) else 0) for shard in range(len(urls))]
+    with ProcessPoolExecutor(max_workers=len(urls)) as pool:
+        futures = [pool.submit(populate_shard_process, url, shard, count) for shard, (url, count) in enumerate(zip(urls, counts))]
+        for future in futures:
+            future.result()
+
 # Run the script
 if __name__ == "__main__":
-    asyncio.run(main())
+    if SHARD_URLS:
+        populate_shards(SHARD_URLS)
+    else:
+        asyncio.run(main())
@@ -0,0 +1,244 @@
+# jobs.py
+#
+# Uzoq davom etadigan hisobot va eksportlar uchun fon vazifalari (job).
+# Job HTTP so'rovdan tashqarida, cheklangan worker pool ichida bajariladi,
+# natija lokal faylga yoziladi. Bir xil parametrli bajarilayotgan joblar
+# takrorlanmaydi. Joblar holati output_dir ichidagi SQLite faylda saqlanadi,
+# shuning uchun bir hostdagi barcha workerlar uni ko'radi va umumiy
+# cheklovga bo'ysunadi.
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class JobQueueFull(Exception):
+    """Navbatda juda ko'p job bor."""
+
+
+class JobLost(Exception):
+    """Job boshqa worker tomonidan to'xtagan deb belgilandi."""
+
+
+class Job:
+    def __init__(self, kind: str, params: dict, key: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.key = key
+        self.status = "queued"  # 'queued', 'running', 'done', 'failed'
+        self.rows_done = 0
+        self.rows_total: Optional[int] = None
+        self.error: Optional[str] = None
+        self.result_path: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Job":
+        job = cls(row["kind"], json.loads(row["params"]), row["key"])
+        for field in ("id", "status", "rows_done", "rows_total", "error", "result_path", "created_at", "finished_at"):
+            setattr(job, field, row[field])
+        return job
+
+    @property
+    def progress(self) -> Optional[float]:
+        if self.status == "done":
+            return 1.0
+        if not self.rows_total:
+            return None
+        return min(1.0, self.rows_done / self.rows_total)
+
+
+JobRunner = Callable[[Job, str], Awaitable[None]]
+
+
+class JobManager:
+    """Joblarni ro'yxatga oladi va ``max_concurrent`` tadan ko'p bo'lmagan holda bajaradi.
+
+    ``runner(job, path)`` writes its result to ``path`` and may update
+    ``job.rows_done`` / ``job.rows_total`` as it goes; the file is moved
+    into place only when the runner finishes successfully.
+
+    Job state lives in ``output_dir/jobs.db``, so every worker on the host
+    can report and serve any job, and ``max_concurrent`` / ``max_queued``
+    apply across workers. A job runs in the worker that accepted it, which
+    refreshes its heartbeat every ``heartbeat_interval`` seconds; queued or
+    running jobs whose heartbeat is older than ``stale_after`` are marked
+    failed.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        max_concurrent: int = 2,
+        max_queued: int = 20,
+        max_finished: int = 200,
+        heartbeat_interval: float = 1.0,
+        stale_after: float = 30.0,
+    ):
+        self.output_dir = output_dir
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        # Shu workerda bajarilayotgan joblar – ularning progressi DB dagidan yangiroq
+        self.jobs: Dict[str, Job] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            conn = sqlite3.connect(
+                os.path.join(self.output_dir, "jobs.db"), timeout=5, isolation_level=None, check_same_thread=False
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, params TEXT NOT NULL, key TEXT NOT NULL, "
+                "status TEXT NOT NULL, rows_done INTEGER NOT NULL, rows_total INTEGER, error TEXT, "
+                "result_path TEXT, created_at REAL NOT NULL, finished_at REAL, heartbeat_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status, created_at)")
+            self._conn = conn
+        return self._conn
+
+    def _transaction(self, fn, *args):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn, *args)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return result
+
+    async def _db(self, fn, *args):
+        return await asyncio.to_thread(self._transaction, fn, *args)
+
+    def _expire_stale(self, conn: sqlite3.Connection, now: float):
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Worker stopped', finished_at = ? "
+            "WHERE status IN ('queued', 'running') AND heartbeat_at < ?",
+            (now, now - self.stale_after),
+        )
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        row = await self._db(lambda conn: conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+        return Job.from_row(row) if row else None
+
+    def _submit(self, conn: sqlite3.Connection, kind: str, params: dict, key: str):
+        now = time.time()
+        self._expire_stale(conn, now)
+        row = conn.execute("SELECT * FROM jobs WHERE key = ? AND status IN ('queued', 'running')", (key,)).fetchone()
+        if row is not None:
+            return Job.from_row(row), False
+        queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        if queued >= self.max_queued:
+            raise JobQueueFull()
+        job = Job(kind, params, key)
+        conn.execute(
+            "INSERT INTO jobs (id, kind, params, key, status, rows_done, created_at, heartbeat_at) "
+            "VALUES (?, ?, ?, ?, ?, 0, ?, ?)",
+            (job.id, kind, json.dumps(params), key, job.status, job.created_at, now),
+        )
+        return job, True
+
+    async def submit(self, kind: str, params: dict, runner: JobRunner) -> Job:
+        key = kind + ":" + json.dumps(params, sort_keys=True)
+        job, created = await self._db(self._submit, kind, params, key)
+        if not created:
+            return self.jobs.get(job.id, job)
+        self.jobs[job.id] = job
+        job._task = asyncio.create_task(self._run(job, runner))
+        return job
+
+    def _claim_slot(self, conn: sqlite3.Connection, job_id: str) -> bool:
+        # Bo'sh joylar navbatdagi eng eski joblarga beriladi
+        now = time.time()
+        self._expire_stale(conn, now)
+        status = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if status is None or status[0] != "queued":
+            raise JobLost("Job was marked as stopped")
+        running = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running'").fetchone()[0]
+        free = self.max_concurrent - running
+        if free <= 0:
+            return False
+        next_ids = conn.execute(
+            "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT ?", (free,)
+        ).fetchall()
+        if job_id not in {row[0] for row in next_ids}:
+            return False
+        conn.execute("UPDATE jobs SET status = 'running', heartbeat_at = ? WHERE id = ?", (now, job_id))
+        return True
+
+    def _save(self, conn: sqlite3.Connection, job: Job):
+        conn.execute(
+            "UPDATE jobs SET status = ?, rows_done = ?, rows_total = ?, error = ?, result_path = ?, "
+            "finished_at = ?, heartbeat_at = ? WHERE id = ?",
+            (job.status, job.rows_done, job.rows_total, job.error, job.result_path, job.finished_at, time.time(), job.id),
+        )
+
+    def _touch(self, conn: sqlite3.Connection, job: Job):
+        # Status bu yerda yozilmaydi – u faqat _claim_slot va _save da o'zgaradi
+        conn.execute(
+            "UPDATE jobs SET rows_done = ?, rows_total = ?, heartbeat_at = ? WHERE id = ?",
+            (job.rows_done, job.rows_total, time.time(), job.id),
+        )
+
+    async def _heartbeat(self, job: Job):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            await self._db(self._touch, job)
+
+    async def _run(self, job: Job, runner: JobRunner):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{job.kind}-{job.id}.csv")
+        tmp_path = path + ".tmp"
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            while not await self._db(self._claim_slot, job.id):
+                await asyncio.sleep(self.heartbeat_interval)
+            job.status = "running"
+            await runner(job, tmp_path)
+            os.replace(tmp_path, path)
+            job.result_path = path
+            job.status = "done"
+        except Exception as exc:
+            job.status = "failed"
+            job.error = str(exc)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        finally:
+            heartbeat.cancel()
+            job.finished_at = time.time()
+            if job.status not in ("done", "failed"):
+                job.status = "failed"
+                job.error = "Cancelled"
+            await self._db(self._save, job)
+            await self._db(self._evict_finished)
+            self.jobs.pop(job.id, None)
+
+    def _evict_finished(self, conn: sqlite3.Connection):
+        evicted = conn.execute(
+            "SELECT id, result_path FROM jobs WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT -1 OFFSET ?",
+            (self.max_finished,),
+        ).fetchall()
+        for job_id, result_path in evicted:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            if result_path and os.path.exists(result_path):
+                os.remove(result_path)
@@ -7,7 +7,7 @@ from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey, Date, func
+from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey, Date, Index, JSON, func
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
@@ -22,6 +22,8 @@ Base = declarative_base()
 # --- Asosiy Model: TimeStampedModel ---
 class TimeStampedModel(Base):
     __abstract__ = True
+    # AUTOINCREMENT – sharding rejimida har bir shard o'z ID oralig'idan foydalanishi uchun
+    __table_args__ = {"sqlite_autoincrement": True}
     created_at = Column(DateTime, default=func.now(), nullable=False)
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
 
@@ -37,7 +39,7 @@ class District(TimeStampedModel):
     __tablename__ = "districts"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
-    region_id = Column(Integer, ForeignKey("regions.id", ondelete="CASCADE"), nullable=False)
+    region_id = Column(Integer, ForeignKey("regions.id", ondelete="CASCADE"), nullable=False, index=True)
     region = relationship("Region", back_populates="districts")
     schools = relationship("School", back_populates="district")
 
@@ -46,7 +48,7 @@ class School(TimeStampedModel):
     __tablename__ = "schools"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
-    district_id = Column(Integer, ForeignKey("districts.id", ondelete="CASCADE"), nullable=False)
+    district_id = Column(Integer, ForeignKey("districts.id", ondelete="CASCADE"), nullable=False, index=True)
     district = relationship("District", back_populates="schools")
 
 # --- Librarian Model ---
@@ -64,7 +66,7 @@ class Librarian(TimeStampedModel):
     adress = Column(String(255), nullable=True)
     is_telegram_authenticated = Column(Boolean, default=False)
     telegram_user_id = Column(String(255), nullable=True)
-    school_id = Column(Integer, ForeignKey("schools.id"), nullable=True)
+    school_id = Column(Integer, ForeignKey("schools.id"), nullable=True, index=True)
     school = relationship("School")
     formulars = relationship("Formular", back_populates="librarian")
 
@@ -79,12 +81,12 @@ class Formular(TimeStampedModel):
     tugilgan_sanasi = Column(Date, nullable=False)
     uid = Column(String, default=lambda: str(uuid.uuid4()), unique=True, nullable=False)
     role = Column(String(20), nullable=False)  # 'oquvchi', 'oqituvchi', 'boshqa'
-    school_id = Column(Integer, ForeignKey("schools.id"), nullable=False)
+    school_id = Column(Integer, ForeignKey("schools.id"), nullable=False, index=True)
     manzili = Column(String(255), nullable=False)
     telefon_raqam = Column(String(13), nullable=False)
     sinf = Column(Integer, nullable=True)
     sinf_type = Column(String(10), nullable=True)
-    librarian_id = Column(Integer, ForeignKey("librarians.id"), nullable=False)
+    librarian_id = Column(Integer, ForeignKey("librarians.id"), nullable=False, index=True)
     librarian = relationship("Librarian", back_populates="formulars")
     transactions = relationship("BookTransaction", back_populates="formular")
 
@@ -92,7 +94,7 @@ class Formular(TimeStampedModel):
 class BookTransaction(TimeStampedModel):
     __tablename__ = "booktransactions"
     id = Column(Integer, primary_key=True, index=True)
-    formular_id = Column(Integer, ForeignKey("formulars.id"), nullable=False)
+    formular_id = Column(Integer, ForeignKey("formulars.id"), nullable=False, index=True)
     kitob_qaytarish_muddati = Column(Date, nullable=False)
     kitob_olingan_sana = Column(DateTime, default=func.now(), nullable=False)
     kitob_qaytarilgan_sana = Column(DateTime, nullable=True)
@@ -103,6 +105,23 @@ class BookTransaction(TimeStampedModel):
     is_returned = Column(Boolean, default=False)
     formular = relationship("Formular", back_populates="transactions")
 
+# --- Change Model (o'zgarishlar jurnali) ---
+class Change(Base):
+    __tablename__ = "changes"
+    __table_args__ = (
+        Index("ix_changes_school_id_seq", "school_id", "seq"),
+        Index("ix_changes_librarian_id_seq", "librarian_id", "seq"),
+        {"sqlite_autoincrement": True},
+    )
+    seq = Column(Integer, primary_key=True)
+    entity = Column(String(50), nullable=False)  # 'regions', 'formulars', ...
+    entity_id = Column(Integer, nullable=False)
+    op = Column(String(10), nullable=False)  # 'create', 'update', 'delete'
+    school_id = Column(Integer, nullable=True)
+    librarian_id = Column(Integer, nullable=True)
+    payload = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+
 # --- Pydantic Schemas ---
 class RegionBase(BaseModel):
     name: str
@@ -187,6 +206,21 @@ class BookTransactionOut(BookTransactionBase):
     kitob_qaytarilgan_sana: Optional[datetime] = None
     model_config = {"from_attributes": True}
 
+class ChangeOut(BaseModel):
+    seq: int
+    entity: str
+    entity_id: int
+    op: str
+    school_id: Optional[int] = None
+    librarian_id: Optional[int] = None
+    payload: Optional[dict] = None
+    created_at: datetime
+    model_config = {"from_attributes": True}
+
+class ChangesOut(BaseModel):
+    changes: List[ChangeOut]
+    last_seq: int
+
 
 # --- Ilova va CORS sozlamalari ---
 app = FastAPI()
@@ -220,17 +254,260 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.future import select
 from sqlalchemy import text  # text() funksiyasini import qilamiz
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy import MetaData, Table, bindparam, delete, event, inspect
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
 from datetime import date
+from collections import defaultdict
 import asyncio
+import csv
+import os
+import secrets
+import time
 
-app = FastAPI()
+from fastapi import Header, Request
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+
+from ratelimit import RateLimiter, MemoryBackend, SQLiteBackend
+from response_compression import CompressionMiddleware
+from jobs import JobManager, JobQueueFull
+from sharding import ShardRouter, UnknownShard, create_schema
+from profiling import ProfiledRoute, ProfilingMiddleware, StackSampler, instrument_engine, waiting
+
+@asynccontextmanager
+async def shard_lifespan(app: FastAPI):
+    # Sharding yoqilgan bo'lsa har bir shard sxemasi va ID oralig'i tayyorlanadi,
+    # aks holda asosiy DB ga yangi jadval va indekslar qo'shiladi
+    if shard_router is not None:
+        await shard_router.create_all(Base.metadata)
+    else:
+        async with engine.begin() as conn:
+            await create_schema(conn, Base.metadata)
+    for db_engine in ([engine] if shard_router is None else shard_router.engines):
+        async with db_engine.begin() as conn:
+            await upgrade_archive_tables(conn)
+    yield
+    if shard_router is not None:
+        await shard_router.dispose()
+
+app = FastAPI(lifespan=shard_lifespan)
+# Endpoint boshlanishi/tugashini belgilash uchun – routelar e'lon qilinishidan oldin o'rnatiladi
+app.router.route_class = ProfiledRoute
+
+# Javoblarni siqish (1 KB dan katta body) va ma'lumotnoma keshi
+compression = CompressionMiddleware(minimum_size=1024)
+app.middleware("http")(compression)
+
+# Rate limiting – har bir mijoz uchun token bucket va og'ir so'rovlar uchun in-flight cheklov.
+# Bir nechta worker ishlatilganda RATE_LIMIT_DB orqali umumiy SQLite backend beriladi.
+# RATE_LIMIT_API_KEYS – vergul bilan ajratilgan, alohida bucket oladigan API kalitlar.
+RATE_LIMIT_DB = os.environ.get("RATE_LIMIT_DB")
+RATE_LIMIT_API_KEYS = [key.strip() for key in os.environ.get("RATE_LIMIT_API_KEYS", "").split(",") if key.strip()]
+rate_limiter = RateLimiter(
+    backend=SQLiteBackend(RATE_LIMIT_DB) if RATE_LIMIT_DB else MemoryBackend(),
+    api_keys=RATE_LIMIT_API_KEYS,
+)
+app.middleware("http")(rate_limiter)
+
+# Profiling – SLOW_REQUEST_MS dan sekin so'rovlar bosqichlari bilan /debug/slow da saqlanadi
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "500"))
+profiler = ProfilingMiddleware(threshold_ms=SLOW_REQUEST_MS, max_traces=100, exclude_prefixes=("/debug", "/changes/stream"))
+stack_sampler = StackSampler()
+app.middleware("http")(profiler)
+
+# Admin endpointlari (/debug, /archive) X-Admin-Token sarlavhasi bilan himoyalanadi;
+# ADMIN_TOKEN o'rnatilmagan bo'lsa ular butunlay yopiq
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN or not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+# ============================================================================
+# O'zgarishlar jurnali – har bir create/update/delete shu tranzaksiya ichida
+# "changes" jadvaliga yoziladi
+# ============================================================================
+CHANGE_TRACKED_MODELS = (Region, District, School, Librarian, Formular, BookTransaction)
+
+class ChangeTrackingSession(Session):
+    pass
+
+def change_scope(connection, obj):
+    """Return the (school_id, librarian_id) a change belongs to, for feed filtering."""
+    state = inspect(obj).dict
+    if isinstance(obj, School):
+        return state.get("id"), None
+    if isinstance(obj, Librarian):
+        return state.get("school_id"), state.get("id")
+    if isinstance(obj, Formular):
+        return state.get("school_id"), state.get("librarian_id")
+    if isinstance(obj, BookTransaction):
+        row = connection.execute(
+            text("SELECT school_id, librarian_id FROM formulars WHERE id = :formular_id"),
+            {"formular_id": state.get("formular_id")}
+        ).first()
+        if row:
+            return row.school_id, row.librarian_id
+    return None, None
+
+def change_payload(obj):
+    # Faqat yuklangan ustunlar olinadi – flush ichida lazy load qilinmaydi
+    state = inspect(obj).dict
+    payload = {}
+    for column in obj.__table__.columns:
+        if column.key in state:
+            value = state[column.key]
+            payload[column.key] = value.isoformat() if isinstance(value, (date, datetime)) else value
+    return payload
+
+@event.listens_for(ChangeTrackingSession, "after_flush")
+def record_changes(session, flush_context):
+    connection = session.connection()
+    changed = (
+        [(obj, "create") for obj in session.new]
+        + [(obj, "update") for obj in session.dirty if session.is_modified(obj)]
+        + [(obj, "delete") for obj in session.deleted]
+    )
+    rows = []
+    for obj, op in changed:
+        if not isinstance(obj, CHANGE_TRACKED_MODELS):
+            continue
+        school_id, librarian_id = change_scope(connection, obj)
+        rows.append({
+            "entity": obj.__tablename__,
+            "entity_id": obj.id,
+            "op": op,
+            "school_id": school_id,
+            "librarian_id": librarian_id,
+            "payload": None if op == "delete" else change_payload(obj),
+        })
+    if rows:
+        connection.execute(Change.__table__.insert(), rows)
+        session.info["changes_pending"] = True
+
+@event.listens_for(ChangeTrackingSession, "after_commit")
+def notify_committed_changes(session):
+    if session.info.pop("changes_pending", False):
+        notify_changes()
+
+@event.listens_for(ChangeTrackingSession, "after_rollback")
+def discard_pending_changes(session):
+    session.info.pop("changes_pending", None)
+
+class ChangeWatcher:
+    """Long-poll va SSE mijozlarini bitta DB dagi yangi o'zgarishlar haqida uyg'otadi.
+
+    Commits made through this worker wake waiters immediately. Commits
+    from other workers are picked up by a single poller per database that
+    reads ``MAX(seq)`` every ``interval`` seconds while anyone is waiting,
+    so idle clients cost one query per interval in total, not one each.
+    """
+
+    def __init__(self, db_engine, interval: float):
+        self.engine = db_engine
+        self.interval = interval
+        self.seq = 0
+        self._waiters = set()
+        self._task = None
+
+    def notify(self):
+        for waiter in list(self._waiters):
+            waiter.set()
+
+    async def wait(self, seen: int, timeout: float) -> bool:
+        """Wait until a change newer than ``seen`` (a previous ``self.seq``) may exist."""
+        if self.seq > seen:
+            return True
+        waiter = asyncio.Event()
+        self._waiters.add(waiter)
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll())
+        try:
+            # Kutish vaqti profilerda sekin so'rov sifatida hisoblanmaydi
+            with waiting():
+                await asyncio.wait_for(waiter.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiters.discard(waiter)
+
+    async def _poll(self):
+        try:
+            while self._waiters:
+                await asyncio.sleep(self.interval)
+                async with self.engine.connect() as conn:
+                    seq = (await conn.execute(select(func.max(Change.seq)))).scalar() or 0
+                if seq > self.seq:
+                    self.seq = seq
+                    self.notify()
+        finally:
+            self._task = None
+
+_change_watchers = {}
+
+def notify_changes():
+    for watcher in list(_change_watchers.values()):
+        watcher.notify()
 
 # SQLAlchemy uchun asosiy sozlashlar
 DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 engine = create_async_engine(DATABASE_URL, echo=True)
-async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession, sync_session_class=ChangeTrackingSession)
+instrument_engine(engine)
+
+# ============================================================================
+# Sharding (ixtiyoriy) – har bir region o'z DB faylida. Masalan:
+# SHARD_URLS="sqlite+aiosqlite:///./shard0.db,sqlite+aiosqlite:///./shard1.db"
+# ============================================================================
+SHARD_URLS = [url.strip() for url in os.environ.get("SHARD_URLS", "").split(",") if url.strip()]
+shard_router = ShardRouter(SHARD_URLS, sync_session_class=ChangeTrackingSession) if SHARD_URLS else None
+for shard_engine in (shard_router.engines if shard_router else []):
+    instrument_engine(shard_engine)
+
+# Shard shu maydonlardagi ID bo'yicha aniqlanadi (path, query yoki body dan)
+SHARD_KEY_FIELDS = ("region_id", "district_id", "school_id", "librarian_id", "formular_id")
+
+async def request_shard(request: Request) -> int:
+    sources = [request.path_params, request.query_params]
+    if request.method in ("POST", "PUT"):
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        if isinstance(body, dict):
+            sources.append(body)
+    shards = set()
+    try:
+        for source in sources:
+            for field in SHARD_KEY_FIELDS:
+                if source.get(field) is not None:
+                    shards.add(shard_router.shard_for_id(int(source[field])))
+    except (TypeError, ValueError):
+        # Noto'g'ri ID – endpoint validatsiyasi 422 qaytaradi
+        return 0
+    except UnknownShard:
+        raise HTTPException(status_code=404, detail="Shard not found")
+    if len(shards) > 1:
+        raise HTTPException(status_code=400, detail="Cross-shard request is not supported")
+    if shards:
+        return shards.pop()
+    if request.method == "POST" and request.url.path.rstrip("/") == "/regions":
+        return shard_router.next_region_shard()
+    return 0
+
+def session_factory_for(entity_id: Optional[int]):
+    if shard_router is None:
+        return async_session
+    return shard_router.sessionmakers[shard_router.shard_for_id(entity_id) if entity_id is not None else 0]
+
+async def fetch_all_shards(db, statement, params=None):
+    # Regionlararo ro'yxatlar barcha shardlardan parallel yig'iladi
+    if shard_router is None:
+        return (await db.execute(statement, params)).fetchall()
+    return await shard_router.fetch_all(statement, params)
 
 # Pydantic modellari
 class RegionBase(BaseModel):
@@ -293,8 +570,9 @@ class FormularOut(FormularBase):
     id: int
 
 # Database sessionni olish uchun dependency
-async def get_db():
-    async with async_session() as session:
+async def get_db(request: Request):
+    factory = async_session if shard_router is None else shard_router.sessionmakers[await request_shard(request)]
+    async with factory() as session:
         yield session
 
 # ============================================================================
@@ -302,8 +580,7 @@ async def get_db():
 # ============================================================================
 @app.get("/regions", response_model=List[RegionOut])
 async def list_regions(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(text("SELECT * FROM regions"))
-    return result.fetchall()
+    return await fetch_all_shards(db, text("SELECT * FROM regions"))
 
 @app.get("/regions/{region_id}", response_model=RegionOut)
 async def get_region(region_id: int, db: AsyncSession = Depends(get_db)):
@@ -344,8 +621,7 @@ async def delete_region(region_id: int, db: AsyncSession = Depends(get_db)):
 # ============================================================================
 @app.get("/districts", response_model=List[DistrictOut])
 async def list_districts(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(text("SELECT * FROM districts"))
-    return result.fetchall()
+    return await fetch_all_shards(db, text("SELECT * FROM districts"))
 
 @app.get("/districts/{district_id}", response_model=DistrictOut)
 async def get_district(district_id: int, db: AsyncSession = Depends(get_db)):
@@ -403,8 +679,7 @@ async def delete_district(district_id: int, db: AsyncSession = Depends(get_db)):
 # ============================================================================
 @app.get("/schools", response_model=List[SchoolOut])
 async def list_schools(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(text("SELECT * FROM schools"))
-    return result.fetchall()
+    return await fetch_all_shards(db, text("SELECT * FROM schools"))
 
 @app.get("/schools/{school_id}", response_model=SchoolOut)
 async def get_school(school_id: int, db: AsyncSession = Depends(get_db)):
@@ -462,8 +737,7 @@ async def delete_school(school_id: int, db: AsyncSession = Depends(get_db)):
 # ============================================================================
 @app.get("/librarians", response_model=List[LibrarianOut])
 async def list_librarians(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(text("SELECT * FROM librarians"))
-    return result.fetchall()
+    return await fetch_all_shards(db, text("SELECT * FROM librarians"))
 
 @app.get("/librarians/{librarian_id}", response_model=LibrarianOut)
 async def get_librarian(librarian_id: int, db: AsyncSession = Depends(get_db)):
@@ -533,8 +807,7 @@ async def delete_librarian(librarian_id: int, db: AsyncSession = Depends(get_db)
 # ============================================================================
 @app.get("/formulars", response_model=List[FormularOut])
 async def list_formulars(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(text("SELECT * FROM formulars"))
-    return result.fetchall()
+    return await fetch_all_shards(db, text("SELECT * FROM formulars"))
 
 @app.get("/formulars/{formular_id}", response_model=FormularOut)
 async def get_formular(formular_id: int, db: AsyncSession = Depends(get_db)):
@@ -625,6 +898,436 @@ async def delete_formular(formular_id: int, db: AsyncSession = Depends(get_db)):
     await db.commit()
     return {"detail": "Formular deleted"}
 
+# ============================================================================
+# BookTransactions Endpointlari
+# ============================================================================
+@app.get("/formulars/{formular_id}/transactions", response_model=List[BookTransactionOut])
+async def get_transactions_by_formular(formular_id: int, include_archived: bool = False, db: AsyncSession = Depends(get_db)):
+    sql = f"SELECT {ARCHIVE_COLUMNS} FROM booktransactions WHERE formular_id = :formular_id"
+    if include_archived:
+        for table in await get_archive_tables(db):
+            sql += f" UNION ALL SELECT {ARCHIVE_COLUMNS} FROM {table} WHERE formular_id = :formular_id"
+    result = await db.execute(text(sql), {"formular_id": formular_id})
+    return result.fetchall()
+
+# ============================================================================
+# Changes Endpointlari – mijozlar faqat o'zgarishlarni (delta) oladi
+# ============================================================================
+CHANGES_PAGE_SIZE = 500
+CHANGES_MAX_WAIT = 30
+CHANGES_POLL_INTERVAL = 1.0
+CHANGES_HEARTBEAT_INTERVAL = 15.0
+
+def change_watcher(db_engine) -> ChangeWatcher:
+    watcher = _change_watchers.get(db_engine)
+    if watcher is None:
+        watcher = _change_watchers[db_engine] = ChangeWatcher(db_engine, CHANGES_POLL_INTERVAL)
+    return watcher
+
+def require_change_filter(school_id: Optional[int], librarian_id: Optional[int]):
+    # Har bir shard o'z seq oralig'iga ega, shuning uchun umumiy lenta faqat bitta shard doirasida tartiblangan
+    if shard_router is not None and school_id is None and librarian_id is None:
+        raise HTTPException(status_code=400, detail="school_id or librarian_id is required when sharding is enabled")
+
+async def fetch_changes(db, since: int, school_id: Optional[int], librarian_id: Optional[int], limit: int):
+    query = select(Change).where(Change.seq > since)
+    if school_id is not None:
+        query = query.where(Change.school_id == school_id)
+    if librarian_id is not None:
+        query = query.where(Change.librarian_id == librarian_id)
+    result = await db.execute(query.order_by(Change.seq).limit(limit))
+    return result.scalars().all()
+
+@app.get("/changes", response_model=ChangesOut)
+async def list_changes(
+    since: int = 0,
+    school_id: Optional[int] = None,
+    librarian_id: Optional[int] = None,
+    limit: int = CHANGES_PAGE_SIZE,
+    wait: float = 0,
+    db: AsyncSession = Depends(get_db),
+):
+    require_change_filter(school_id, librarian_id)
+    limit = max(1, min(limit, CHANGES_PAGE_SIZE))
+    deadline = time.monotonic() + max(0.0, min(wait, CHANGES_MAX_WAIT))
+    watcher = change_watcher(db.bind)
+    while True:
+        seen = watcher.seq
+        changes = await fetch_changes(db, since, school_id, librarian_id, limit)
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            break
+        # Kutishdan oldin o'qish tranzaksiyasini yopamiz, aks holda SQLite yozuvchilarni bloklaydi
+        await db.rollback()
+        await watcher.wait(seen, remaining)
+    return {"changes": changes, "last_seq": changes[-1].seq if changes else since}
+
+async def stream_changes(since: int, school_id: Optional[int], librarian_id: Optional[int]):
+    last_sent = time.monotonic()
+    session_factory = session_factory_for(school_id if school_id is not None else librarian_id)
+    watcher = change_watcher(session_factory.kw["bind"])
+    while True:
+        seen = watcher.seq
+        async with session_factory() as session:
+            changes = await fetch_changes(session, since, school_id, librarian_id, CHANGES_PAGE_SIZE)
+        for change in changes:
+            since = change.seq
+            data = ChangeOut.model_validate(change).model_dump_json()
+            yield f"id: {change.seq}\nevent: change\ndata: {data}\n\n"
+            last_sent = time.monotonic()
+        if len(changes) < CHANGES_PAGE_SIZE:
+            await watcher.wait(seen, max(0.0, CHANGES_HEARTBEAT_INTERVAL - (time.monotonic() - last_sent)))
+        if time.monotonic() - last_sent >= CHANGES_HEARTBEAT_INTERVAL:
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+
+@app.get("/changes/stream")
+async def changes_stream(
+    since: int = 0,
+    school_id: Optional[int] = None,
+    librarian_id: Optional[int] = None,
+    last_event_id: Optional[int] = Header(None),
+):
+    require_change_filter(school_id, librarian_id)
+    # Qayta ulangan EventSource oxirgi olingan seq ni Last-Event-ID orqali yuboradi
+    if last_event_id is not None:
+        since = last_event_id
+    return StreamingResponse(
+        stream_changes(since, school_id, librarian_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+# ============================================================================
+# Arxivlash – qaytarilgan eski BookTransactionlar yillik arxiv jadvallariga ko'chiriladi
+# ============================================================================
+ARCHIVE_AFTER_DAYS = 180
+ARCHIVE_BATCH_SIZE = 5000
+ARCHIVE_TABLE_PREFIX = "booktransactions_archive_"
+ARCHIVE_COLUMNS = ", ".join(column.name for column in BookTransaction.__table__.columns)
+
+async def get_archive_tables(conn) -> List[str]:
+    result = await conn.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB :pattern ORDER BY name"),
+        {"pattern": ARCHIVE_TABLE_PREFIX + "[0-9]*"}
+    )
+    return [row.name for row in result.fetchall()]
+
+def archive_table(name: str) -> Table:
+    # Asosiy jadval ustunlari va id INTEGER PRIMARY KEY; tashqi kalitlar va boshqa indekslarsiz
+    return Table(name, MetaData(), *(
+        Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+        for column in BookTransaction.__table__.columns
+    ))
+
+async def ensure_archive_table(conn, period: str) -> str:
+    # Arxiv jadvali id bo'yicha kalitga (keyset eksport uchun) va formular_id indeksiga ega
+    table = ARCHIVE_TABLE_PREFIX + period
+    await conn.execute(CreateTable(archive_table(table), if_not_exists=True))
+    await conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_formular_id ON {table} (formular_id)"))
+    return table
+
+async def upgrade_archive_tables(conn):
+    # Oldin CREATE TABLE AS SELECT bilan yaratilgan arxiv jadvallarida id kaliti yo'q
+    for table in await get_archive_tables(conn):
+        columns = (await conn.execute(text(f"PRAGMA table_info({table})"))).fetchall()
+        if not any(column.name == "id" and column.pk for column in columns):
+            await conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_id ON {table} (id)"))
+
+async def archive_returned_transactions(older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE, db_engine=None, job=None) -> int:
+    """Move returned transactions older than ``older_than_days`` into per-year archive tables.
+
+    Each batch runs in its own short transaction so the write lock on
+    ``booktransactions`` is released between batches. Batches continue
+    from the last archived id, so every batch reads forward from where the
+    previous one stopped instead of rescanning the table. ``db_engine``
+    defaults to the main database; ``job.rows_done`` is advanced per batch.
+    """
+    db_engine = db_engine or engine
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    period_column = func.strftime("%Y", BookTransaction.kitob_qaytarilgan_sana).label("period")
+    # (is_returned, kitob_qaytarilgan_sana) indeksi ishlatilmaydi: u bilan har partiya
+    # barcha nomzodlarni id bo'yicha qayta saralashi kerak bo'lardi
+    batch_query = (
+        select(BookTransaction.id, period_column)
+        .where(
+            BookTransaction.id > bindparam("last_id"),
+            BookTransaction.is_returned == True,
+            BookTransaction.kitob_qaytarilgan_sana < cutoff,
+        )
+        .order_by(BookTransaction.id)
+        .limit(batch_size)
+    )
+    archived, last_id = 0, 0
+    while True:
+        async with db_engine.begin() as conn:
+            rows = (await conn.execute(batch_query, {"last_id": last_id})).fetchall()
+            if not rows:
+                break
+            ids_by_period = defaultdict(list)
+            for row in rows:
+                ids_by_period[row.period].append(row.id)
+            for period, ids in ids_by_period.items():
+                table = await ensure_archive_table(conn, period)
+                await conn.execute(
+                    text(f"INSERT INTO {table} ({ARCHIVE_COLUMNS}) SELECT {ARCHIVE_COLUMNS} FROM booktransactions WHERE id IN :ids")
+                    .bindparams(bindparam("ids", expanding=True)),
+                    {"ids": ids}
+                )
+                await conn.execute(delete(BookTransaction).where(BookTransaction.id.in_(ids)))
+        archived += len(rows)
+        last_id = rows[-1].id
+        if job is not None:
+            job.rows_done += len(rows)
+        # Boshqa so'rovlar DB lock ni olishi uchun partiyalar orasida navbat beramiz
+        await asyncio.sleep(0)
+    return archived
+
+# ============================================================================
+# Jobs Endpointlari – uzoq davom etadigan eksport va hisobotlar
+# ============================================================================
+EXPORT_DIR = "./exports"
+EXPORT_CHUNK_SIZE = 1000
+
+job_manager = JobManager(EXPORT_DIR, max_concurrent=2)
+
+class ExportJobCreate(BaseModel):
+    kind: Literal["formulars", "transactions", "loan_stats"]
+    region_id: Optional[int] = None
+    school_id: Optional[int] = None
+    # Sukut bo'yicha eksport va statistika arxiv jadvallarini ham qamrab oladi (to'liq tarix)
+    include_archived: bool = True
+
+class JobOut(BaseModel):
+    id: str
+    kind: str
+    status: str
+    rows_done: int
+    rows_total: Optional[int] = None
+    progress: Optional[float] = None
+    error: Optional[str] = None
+    download_url: Optional[str] = None
+    model_config = {"from_attributes": True}
+
+# Har bir eksport turi uchun: (so'rov, keyset ustuni, CSV sarlavhasi).
+# {table} o'rniga booktransactions yoki uning arxiv jadvallari qo'yiladi
+EXPORT_QUERIES = {
+    "formulars": (
+        "SELECT f.* FROM formulars f",
+        [("f.id", "id")],
+        [column.name for column in Formular.__table__.columns],
+    ),
+    "transactions": (
+        "SELECT t.* FROM {table} t JOIN formulars f ON f.id = t.formular_id",
+        [("f.id", "formular_id"), ("t.id", "id")],
+        [column.name for column in BookTransaction.__table__.columns],
+    ),
+    "loan_stats": (
+        "SELECT f.school_id, COUNT(*) AS total, "
+        "SUM(CASE WHEN t.is_returned = 0 THEN 1 ELSE 0 END) AS open_loans, "
+        "SUM(CASE WHEN t.is_returned = 0 AND t.kitob_qaytarish_muddati < date('now') THEN 1 ELSE 0 END) AS overdue "
+        "FROM {table} t JOIN formulars f ON f.id = t.formular_id",
+        [("f.school_id", "school_id")],
+        ["school_id", "total", "open_loans", "overdue"],
+    ),
+}
+
+def build_export_query(export: ExportJobCreate, sql: str, *conditions: str):
+    where, params = list(conditions), {}
+    if export.region_id is not None:
+        sql += " JOIN schools s ON s.id = f.school_id JOIN districts d ON d.id = s.district_id"
+        where.append("d.region_id = :region_id")
+        params["region_id"] = export.region_id
+    if export.school_id is not None:
+        where.append("f.school_id = :school_id")
+        params["school_id"] = export.school_id
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql, params
+
+def export_engines(export: ExportJobCreate):
+    if shard_router is None:
+        return [engine]
+    scope_id = export.region_id if export.region_id is not None else export.school_id
+    if scope_id is not None:
+        return [shard_router.engines[shard_router.shard_for_id(scope_id)]]
+    return shard_router.engines
+
+async def export_tables(export: ExportJobCreate, db_engine) -> List[str]:
+    if export.kind == "formulars":
+        return ["formulars"]
+    if not export.include_archived:
+        return ["booktransactions"]
+    async with db_engine.connect() as conn:
+        return ["booktransactions"] + await get_archive_tables(conn)
+
+async def export_scopes(export: ExportJobCreate, db_engine) -> List[ExportJobCreate]:
+    """Split a region export into one export per school of the region.
+
+    Within one school every keyset chunk follows the order of the
+    ``school_id`` / ``formular_id`` indexes, while a whole region would
+    have to be sorted again for every chunk.
+    """
+    if export.region_id is None or export.school_id is not None:
+        return [export]
+    async with db_engine.connect() as conn:
+        school_ids = (await conn.execute(
+            text("SELECT s.id FROM schools s JOIN districts d ON d.id = s.district_id WHERE d.region_id = :region_id ORDER BY d.id, s.id"),
+            {"region_id": export.region_id},
+        )).scalars().all()
+    return [export.model_copy(update={"region_id": None, "school_id": school_id}) for school_id in school_ids]
+
+async def export_chunks(export: ExportJobCreate, db_engine, tables: List[str]):
+    """Yield the export rows of one database in chunks of ``EXPORT_CHUNK_SIZE``.
+
+    Rows are paged by key (``(key) > (:last_key) ORDER BY key LIMIT n``)
+    and every chunk is read on its own short-lived connection, so an
+    export never keeps a read transaction open long enough to block
+    writers. Transactions are keyed by ``(formular, id)`` so that a
+    school's chunks can be read through the ``formular_id`` index without
+    sorting. Region exports are read school by school (``export_scopes``).
+    ``loan_stats`` pages over school ids and sums each school's counts
+    across ``tables``.
+    """
+    sql, key, _ = EXPORT_QUERIES[export.kind]
+    limit = {"limit": EXPORT_CHUNK_SIZE}
+    if export.kind == "loan_stats":
+        schools_sql, params = build_export_query(export, "SELECT DISTINCT f.school_id FROM formulars f", "f.school_id > :last_key")
+        schools_query = text(schools_sql + " ORDER BY f.school_id LIMIT :limit")
+        stats_queries = [
+            text(build_export_query(export, sql.format(table=table), "f.school_id BETWEEN :first_key AND :last_key")[0] + " GROUP BY f.school_id")
+            for table in tables
+        ]
+        last_key = 0
+        while True:
+            async with db_engine.connect() as conn:
+                school_ids = (await conn.execute(schools_query, {**params, **limit, "last_key": last_key})).scalars().all()
+                if not school_ids:
+                    return
+                totals = {}
+                for stats_query in stats_queries:
+                    chunk_params = {**params, "first_key": school_ids[0], "last_key": school_ids[-1]}
+                    for school_id, *counts in await conn.execute(stats_query, chunk_params):
+                        totals[school_id] = [a + b for a, b in zip(totals.get(school_id, (0, 0, 0)), counts)]
+            yield [(school_id, *totals[school_id]) for school_id in school_ids if school_id in totals]
+            last_key = school_ids[-1]
+
+    columns = ", ".join(expr for expr, _ in key)
+    placeholders = ", ".join(f":last_key_{i}" for i in range(len(key)))
+    for scope in await export_scopes(export, db_engine):
+        for table in tables:
+            table_sql, params = build_export_query(scope, sql.format(table=table), f"({columns}) > ({placeholders})")
+            query = text(table_sql + f" ORDER BY {columns} LIMIT :limit")
+            last_key = {f"last_key_{i}": 0 for i in range(len(key))}
+            while True:
+                async with db_engine.connect() as conn:
+                    rows = (await conn.execute(query, {**params, **limit, **last_key})).fetchall()
+                if not rows:
+                    break
+                yield rows
+                last_key = {f"last_key_{i}": rows[-1]._mapping[column] for i, (_, column) in enumerate(key)}
+
+async def run_export_job(job, path: str):
+    export = ExportJobCreate(kind=job.kind, **job.params)
+    sql, _, columns = EXPORT_QUERIES[export.kind]
+    sources = [(db_engine, await export_tables(export, db_engine)) for db_engine in export_engines(export)]
+    if export.kind != "loan_stats":
+        job.rows_total = 0
+        for db_engine, tables in sources:
+            async with db_engine.connect() as conn:
+                for table in tables:
+                    count_sql, params = build_export_query(export, sql.format(table=table))
+                    job.rows_total += (await conn.execute(text(f"SELECT COUNT(*) FROM ({count_sql})"), params)).scalar()
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for db_engine, tables in sources:
+            async for rows in export_chunks(export, db_engine, tables):
+                await asyncio.to_thread(writer.writerows, rows)
+                job.rows_done += len(rows)
+
+def job_out(job) -> JobOut:
+    out = JobOut.model_validate(job)
+    if job.status == "done":
+        out.download_url = f"/jobs/{job.id}/download"
+    return out
+
+@app.post("/jobs/export", response_model=JobOut, status_code=202)
+async def create_export_job(export: ExportJobCreate):
+    try:
+        job = await job_manager.submit(export.kind, export.model_dump(exclude={"kind"}), run_export_job)
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="Too many queued jobs", headers={"Retry-After": "30"})
+    return job_out(job)
+
+@app.get("/jobs/{job_id}", response_model=JobOut)
+async def get_job(job_id: str):
+    job = await job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_out(job)
+
+@app.get("/jobs/{job_id}/download")
+async def download_job_result(job_id: str):
+    job = await job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail="Job is not finished")
+    return FileResponse(job.result_path, media_type="text/csv", filename=os.path.basename(job.result_path))
+
+# Arxivlash job sifatida fonda bajariladi; holati GET /jobs/{id} orqali kuzatiladi
+async def run_archive_job(job, path: str):
+    engines = [engine] if shard_router is None else shard_router.engines
+    counts = await asyncio.gather(*(
+        archive_returned_transactions(job.params["older_than_days"], job.params["batch_size"], db_engine, job)
+        for db_engine in engines
+    ))
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["shard", "archived"])
+        writer.writerows(enumerate(counts))
+
+@app.post("/archive/booktransactions", response_model=JobOut, status_code=202, dependencies=[Depends(require_admin)])
+async def run_booktransactions_archive(older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE):
+    if older_than_days < 0 or batch_size < 1:
+        raise HTTPException(status_code=400, detail="Invalid archive parameters")
+    params = {"older_than_days": older_than_days, "batch_size": batch_size}
+    try:
+        job = await job_manager.submit("archive", params, run_archive_job)
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="Too many queued jobs", headers={"Retry-After": "30"})
+    return job_out(job)
+
+# ============================================================================
+# Debug Endpointlari – faqat admin uchun
+# ============================================================================
+PROFILE_MAX_SECONDS = 60
+
+@app.get("/debug/slow", dependencies=[Depends(require_admin)])
+async def list_slow_requests(limit: int = 100):
+    traces = list(profiler.slow)[-limit:] if limit > 0 else []
+    return {"threshold_ms": profiler.threshold_ms, "traces": traces[::-1]}
+
+@app.delete("/debug/slow", dependencies=[Depends(require_admin)])
+async def clear_slow_requests():
+    profiler.slow.clear()
+    return {"detail": "Slow request traces cleared"}
+
+@app.post("/debug/profile", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def run_profile(seconds: float = 10, interval_ms: float = 5):
+    # Natija flamegraph.pl / speedscope uchun "collapsed stack" formatida
+    if not 0 < seconds <= PROFILE_MAX_SECONDS or interval_ms < 1:
+        raise HTTPException(status_code=400, detail="Invalid profiling parameters")
+    if stack_sampler.running:
+        raise HTTPException(status_code=409, detail="Profiling is already running")
+    stack_sampler.start(interval_ms / 1000)
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        stack_sampler.stop()
+    return stack_sampler.collapsed()
+
 # ============================================================================
 # Run the FastAPI app
 # ============================================================================
@@ -0,0 +1,219 @@
+# profiling.py
+#
+# Sekin so'rovlarni aniqlash va profiling. Har bir so'rov uchun bosqichlar
+# vaqti (dependency, DB execute, fetch, serialization) yig'iladi; chegaradan
+# oshgan so'rovlar ring buffer'da saqlanadi. Talab bo'yicha sampling profiler
+# flamegraph uchun "collapsed stack" formatida natija beradi.
+
+import inspect
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from fastapi import Request
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+MAX_TRACE_STATEMENTS = 20
+
+
+class RequestTrace:
+    """Bitta so'rov davomida yig'iladigan vaqt belgilari (perf_counter soniyalarida)."""
+
+    __slots__ = (
+        "started", "handler_started", "endpoint_started", "endpoint_finished", "response_ready",
+        "db_time", "db_statements", "statements", "idle_time",
+    )
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.handler_started = None
+        self.endpoint_started = None
+        self.endpoint_finished = None
+        self.response_ready = None
+        self.db_time = 0.0
+        self.db_statements = 0
+        self.statements: List[tuple] = []
+        # Ataylab kutilgan vaqt (masalan long-poll) – sekinlik chegarasiga kirmaydi
+        self.idle_time = 0.0
+
+    def phases(self, finished: float) -> Dict[str, float]:
+        """Split the request into phases, in milliseconds.
+
+        ``fetch`` is the endpoint time not spent inside cursor execution:
+        row fetching, ORM loading and any other work in the handler body,
+        excluding ``idle`` time the handler deliberately spent waiting.
+        """
+        ms = lambda seconds: round(seconds * 1000, 3)
+        phases = {"total": ms(finished - self.started), "db_execute": ms(self.db_time)}
+        if self.idle_time:
+            phases["idle"] = ms(self.idle_time)
+        if self.handler_started is not None and self.endpoint_started is not None:
+            phases["dependencies"] = ms(self.endpoint_started - self.handler_started)
+        if self.endpoint_started is not None and self.endpoint_finished is not None:
+            phases["fetch"] = ms(max(0.0, self.endpoint_finished - self.endpoint_started - self.db_time - self.idle_time))
+        if self.endpoint_finished is not None and self.response_ready is not None:
+            phases["serialization"] = ms(self.response_ready - self.endpoint_finished)
+        return phases
+
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+
+def _timed_endpoint(call):
+    async def endpoint(*args, **kwargs):
+        trace = current_trace.get()
+        if trace is not None:
+            trace.endpoint_started = time.perf_counter()
+        try:
+            return await call(*args, **kwargs)
+        finally:
+            if trace is not None:
+                trace.endpoint_finished = time.perf_counter()
+
+    endpoint.__wrapped__ = call
+    return endpoint
+
+
+class ProfiledRoute(APIRoute):
+    """APIRoute: endpoint boshlanishi/tugashi va javob tayyor bo'lgan vaqtni belgilaydi."""
+
+    def get_route_handler(self):
+        call = self.dependant.call
+        if inspect.iscoroutinefunction(call) and not hasattr(call, "__wrapped__"):
+            self.dependant.call = _timed_endpoint(call)
+        handler = super().get_route_handler()
+
+        async def profiled_handler(request: Request):
+            trace = current_trace.get()
+            if trace is not None:
+                trace.handler_started = time.perf_counter()
+            response = await handler(request)
+            if trace is not None:
+                trace.response_ready = time.perf_counter()
+            return response
+
+        return profiled_handler
+
+
+def instrument_engine(engine: AsyncEngine):
+    """Cursor execute vaqtini joriy so'rov trace'iga qo'shadi."""
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if current_trace.get() is not None:
+            context._profiling_started = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        trace = current_trace.get()
+        started = getattr(context, "_profiling_started", None)
+        if trace is None or started is None:
+            return
+        elapsed = time.perf_counter() - started
+        trace.db_time += elapsed
+        trace.db_statements += 1
+        if len(trace.statements) < MAX_TRACE_STATEMENTS:
+            trace.statements.append((statement, round(elapsed * 1000, 3)))
+
+
+@contextmanager
+def waiting():
+    """Ichidagi kutish vaqtini joriy so'rovning ``idle_time`` iga qo'shadi."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace = current_trace.get()
+        if trace is not None:
+            trace.idle_time += time.perf_counter() - started
+
+
+class ProfilingMiddleware:
+    """HTTP middleware: ``threshold_ms`` dan sekin so'rovlarni oxirgi ``max_traces`` ta bilan saqlaydi.
+
+    Time spent inside :func:`waiting` (long-poll waits) does not count
+    towards the threshold.
+    """
+
+    def __init__(self, threshold_ms: float = 500.0, max_traces: int = 100, exclude_prefixes=("/debug",)):
+        self.threshold_ms = threshold_ms
+        self.exclude_prefixes = tuple(exclude_prefixes)
+        self.slow = deque(maxlen=max_traces)
+
+    async def __call__(self, request: Request, call_next):
+        if request.url.path.startswith(self.exclude_prefixes):
+            return await call_next(request)
+        trace = RequestTrace()
+        token = current_trace.set(trace)
+        try:
+            response = await call_next(request)
+        finally:
+            current_trace.reset(token)
+        finished = time.perf_counter()
+        if (finished - trace.started - trace.idle_time) * 1000 >= self.threshold_ms:
+            self.slow.append({
+                "method": request.method,
+                "path": request.url.path,
+                "query": request.url.query,
+                "status_code": response.status_code,
+                "timestamp": time.time(),
+                "phases": trace.phases(finished),
+                "db_statements": trace.db_statements,
+                "statements": [{"sql": sql[:500], "ms": ms} for sql, ms in trace.statements],
+            })
+        return response
+
+
+class StackSampler:
+    """Talab bo'yicha ishlaydigan sampling profiler.
+
+    While running, a background thread snapshots every thread's stack each
+    ``interval`` seconds; nothing is sampled when it is idle. ``collapsed()``
+    returns the samples in the folded format read by flamegraph.pl and
+    speedscope: ``thread;outer;...;inner count`` per line.
+    """
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.samples: Counter = Counter()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float):
+        self.samples = Counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, interval: float):
+        own_id = threading.get_ident()
+        while not self._stop.wait(interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
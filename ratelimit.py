@@ -0,0 +1,251 @@
+# ratelimit.py
+#
+# Har bir mijoz (API kalit yoki IP) uchun token bucket rate limiting va
+# og'ir (list/export) so'rovlar uchun bir vaqtda bajariladigan so'rovlar
+# cheklovi. Limitdan oshgan so'rovlar DB ga yetib bormasdan 429/503 bilan
+# qaytariladi.
+
+import asyncio
+import math
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+
+class RateLimitBackend(ABC):
+    """Token bucket holatini saqlovchi backend interfeysi."""
+
+    @abstractmethod
+    async def take(self, key: str, rate: float, burst: int, cost: int = 1) -> float:
+        """Consume ``cost`` tokens for ``key``.
+
+        Returns 0 when the request is admitted, otherwise the number of
+        seconds until enough tokens will be available.
+        """
+
+
+class MemoryBackend(RateLimitBackend):
+    """Bitta worker ichida xotirada saqlanadigan backend."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        # key -> (tokens, last_refill); dict tartibi LRU sifatida ishlatiladi
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    async def take(self, key: str, rate: float, burst: int, cost: int = 1) -> float:
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(key, (float(burst), now))
+        tokens = min(float(burst), tokens + (now - last) * rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            del self._buckets[next(iter(self._buckets))]
+        return wait
+
+
+class SQLiteBackend(RateLimitBackend):
+    """Bir nechta worker o'rtasida umumiy bo'lgan, SQLite faylga asoslangan backend.
+
+    Every worker on the host points at the same file; ``BEGIN IMMEDIATE``
+    serializes the read-modify-write of a bucket across processes. Buckets
+    untouched for ``stale_after`` seconds are deleted at most once per
+    ``prune_interval``; a deleted bucket is recreated full, so
+    ``stale_after`` must be at least ``burst / rate``.
+    """
+
+    def __init__(self, path: str, stale_after: float = 3600.0, prune_interval: float = 60.0):
+        self.stale_after = stale_after
+        self.prune_interval = prune_interval
+        self._last_prune = 0.0
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_buckets_updated_at ON rate_buckets (updated_at)")
+        self._lock = threading.Lock()
+
+    def _take(self, key: str, rate: float, burst: int, cost: int) -> float:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens, last = row if row else (float(burst), now)
+                tokens = min(float(burst), tokens + max(0.0, now - last) * rate)
+                wait = 0.0
+                if tokens >= cost:
+                    tokens -= cost
+                else:
+                    wait = (cost - tokens) / rate
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens, now),
+                )
+                if now - self._last_prune >= self.prune_interval:
+                    self._conn.execute("DELETE FROM rate_buckets WHERE updated_at < ?", (now - self.stale_after,))
+                    self._last_prune = now
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    async def take(self, key: str, rate: float, burst: int, cost: int = 1) -> float:
+        return await asyncio.to_thread(self._take, key, rate, burst, cost)
+
+
+class InFlightLimiter:
+    """Bir vaqtda bajarilayotgan so'rovlar soni uchun bloklanmaydigan cheklov.
+
+    The budget is per worker process: with N workers the effective global
+    cap is N * ``limit``.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= self.limit:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+
+# Filtrsiz list va nested list endpointlari – DB uchun eng qimmat so'rovlar
+EXPENSIVE_ROUTES = (
+    r"^/(regions|districts|schools|librarians|formulars|booktransactions)/?$",
+    r"^/[a-z]+/\d+/(districts|schools|librarians|formulars|transactions)/?$",
+)
+
+# Ochiq turadigan so'rovlar: SSE oqimi doim, long-poll esa wait > 0 bo'lganda
+STREAM_ROUTES = (r"^/changes/stream/?$",)
+LONG_POLL_ROUTES = (r"^/changes/?$",)
+
+
+class RateLimiter:
+    """HTTP middleware: mijoz bo'yicha rate limit va in-flight budget.
+
+    Clients are keyed by ``api_key_header`` when it carries one of
+    ``api_keys``, otherwise by IP. Requests over the client's token budget
+    get 429, requests that would exceed the in-flight budget get 503 without
+    spending tokens; both carry ``Retry-After``.
+    Expensive GET routes cost ``expensive_cost`` tokens and additionally
+    hold a slot in a smaller dedicated in-flight budget. Streams and
+    long-polls (``wait`` > 0) mostly sit idle, so they hold a slot in their
+    own ``max_long_poll_in_flight`` budget instead of the shared one.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[RateLimitBackend] = None,
+        rate: float = 20.0,
+        burst: int = 40,
+        expensive_cost: int = 5,
+        max_in_flight: int = 256,
+        max_expensive_in_flight: int = 8,
+        expensive_routes: Iterable[str] = EXPENSIVE_ROUTES,
+        max_long_poll_in_flight: int = 2048,
+        stream_routes: Iterable[str] = STREAM_ROUTES,
+        long_poll_routes: Iterable[str] = LONG_POLL_ROUTES,
+        api_key_header: str = "X-API-Key",
+        api_keys: Iterable[str] = (),
+        enabled: bool = True,
+    ):
+        self.backend = backend or MemoryBackend()
+        self.rate = rate
+        self.burst = burst
+        self.expensive_cost = expensive_cost
+        self.in_flight = InFlightLimiter(max_in_flight)
+        self.expensive_in_flight = InFlightLimiter(max_expensive_in_flight)
+        self.expensive_routes = [re.compile(pattern) for pattern in expensive_routes]
+        self.long_poll_in_flight = InFlightLimiter(max_long_poll_in_flight)
+        self.stream_routes = [re.compile(pattern) for pattern in stream_routes]
+        self.long_poll_routes = [re.compile(pattern) for pattern in long_poll_routes]
+        self.api_key_header = api_key_header
+        self.api_keys = frozenset(api_keys)
+        self.enabled = enabled
+
+    def client_key(self, request: Request) -> str:
+        # Faqat ma'lum kalitlar alohida bucket oladi – aks holda har so'rovda
+        # yangi kalit yuborib limitni chetlab o'tish mumkin
+        api_key = request.headers.get(self.api_key_header)
+        if api_key and api_key in self.api_keys:
+            return f"key:{api_key}"
+        host = request.client.host if request.client else "unknown"
+        return f"ip:{host}"
+
+    def is_expensive(self, request: Request) -> bool:
+        if request.method != "GET":
+            return False
+        path = request.url.path
+        return any(pattern.match(path) for pattern in self.expensive_routes)
+
+    def is_long_poll(self, request: Request) -> bool:
+        if request.method != "GET":
+            return False
+        path = request.url.path
+        if any(pattern.match(path) for pattern in self.stream_routes):
+            return True
+        if not any(pattern.match(path) for pattern in self.long_poll_routes):
+            return False
+        try:
+            return float(request.query_params.get("wait", 0)) > 0
+        except ValueError:
+            return False
+
+    @staticmethod
+    def _reject(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+        return JSONResponse(
+            status_code=status_code,
+            content={"detail": detail},
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    def budgets(self, request: Request, expensive: bool) -> List[Tuple[InFlightLimiter, str]]:
+        """In-flight budgets the request must hold a slot in, with their 503 messages."""
+        if self.is_long_poll(request):
+            return [(self.long_poll_in_flight, "Too many long-poll requests in flight")]
+        budgets = [(self.in_flight, "Server is overloaded")]
+        if expensive:
+            budgets.append((self.expensive_in_flight, "Too many expensive requests in flight"))
+        return budgets
+
+    async def __call__(self, request: Request, call_next):
+        if not self.enabled:
+            return await call_next(request)
+
+        expensive = self.is_expensive(request)
+        # Slotlar tokenlardan oldin olinadi – 503 bilan qaytarilgan so'rov mijoz tokenlarini sarflamaydi
+        acquired = []
+        try:
+            for limiter, detail in self.budgets(request, expensive):
+                if not limiter.try_acquire():
+                    return self._reject(503, detail, 1)
+                acquired.append(limiter)
+
+            cost = self.expensive_cost if expensive else 1
+            wait = await self.backend.take(self.client_key(request), self.rate, self.burst, cost)
+            if wait > 0:
+                return self._reject(429, "Too many requests", wait)
+            return await call_next(request)
+        finally:
+            for limiter in acquired:
+                limiter.release()
@@ -0,0 +1,219 @@
+# response_compression.py
+#
+# Accept-Encoding bo'yicha javoblarni siqish (zstd / br / gzip) va
+# ma'lumotnoma (region, district, school) javoblari uchun kesh. Keshda
+# siqilgan body ham saqlanadi, shuning uchun har bir encoding uchun siqish
+# har so'rovda emas, har invalidatsiyada bir marta bajariladi.
+
+import asyncio
+import gzip
+import re
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli ixtiyoriy
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard ixtiyoriy
+    zstandard = None
+
+
+# Server afzal ko'radigan tartibda: mavjud bo'lmagan kodeklar tashlab yuboriladi
+CODECS: Dict[str, Callable[[bytes], bytes]] = {}
+if zstandard is not None:
+    CODECS["zstd"] = zstandard.ZstdCompressor(level=3).compress
+if brotli is not None:
+    CODECS["br"] = lambda data: brotli.compress(data, quality=5)
+CODECS["gzip"] = lambda data: gzip.compress(data, compresslevel=6, mtime=0)
+
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html")
+# Bundan katta body'lar event loop'ni bloklamasligi uchun alohida threadda siqiladi
+THREAD_COMPRESS_SIZE = 64 * 1024
+
+
+async def compress(encoding: str, body: bytes) -> bytes:
+    if len(body) >= THREAD_COMPRESS_SIZE:
+        return await asyncio.to_thread(CODECS[encoding], body)
+    return CODECS[encoding](body)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best supported encoding from an ``Accept-Encoding`` header."""
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in CODECS:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CacheEntry:
+    """Keshlangan javob: asl body va encoding bo'yicha siqilgan nusxalari."""
+
+    def __init__(self, body: bytes, media_type: str, expires_at: float):
+        self.body = body
+        self.media_type = media_type
+        self.expires_at = expires_at
+        self.encoded: Dict[str, bytes] = {}
+
+    async def get_body(self, encoding: Optional[str]) -> bytes:
+        if encoding is None:
+            return self.body
+        if encoding not in self.encoded:
+            self.encoded[encoding] = await compress(encoding, self.body)
+        return self.encoded[encoding]
+
+
+class ReferenceCache:
+    """Worker ichidagi kesh. TTL boshqa workerlardagi yozuvlardan keyingi eskirishni cheklaydi.
+
+    ``generation`` grows on every invalidation. A response read before an
+    invalidation is not stored, so a slow GET cannot put pre-write data
+    back into the cache after the write cleared it.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_entries: int = 10_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[str, CacheEntry] = {}
+        self.generation = 0
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        return entry
+
+    def put(self, key: str, body: bytes, media_type: str, generation: Optional[int] = None) -> CacheEntry:
+        """Store ``body`` unless the cache was invalidated since ``generation`` was read."""
+        entry = CacheEntry(body, media_type, time.monotonic() + self.ttl)
+        if generation is not None and generation != self.generation:
+            return entry
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+        self._entries[key] = entry
+        return entry
+
+    def invalidate(self):
+        self.generation += 1
+        self._entries.clear()
+
+
+# Kam o'zgaradigan ma'lumotnoma endpointlari
+CACHEABLE_ROUTES = (
+    r"^/(regions|districts|schools)$",
+    r"^/(regions|districts|schools)/\d+$",
+    r"^/regions/\d+/districts$",
+    r"^/districts/\d+/schools$",
+)
+INVALIDATE_PREFIXES = ("/regions", "/districts", "/schools")
+
+
+class CompressionMiddleware:
+    """HTTP middleware: Accept-Encoding bo'yicha siqish va ma'lumotnoma keshi.
+
+    Bodies smaller than ``minimum_size`` are sent as-is. Any successful
+    write under ``invalidate_prefixes`` clears the reference cache.
+    """
+
+    def __init__(
+        self,
+        minimum_size: int = 1024,
+        cache: Optional[ReferenceCache] = None,
+        cacheable_routes: Iterable[str] = CACHEABLE_ROUTES,
+        invalidate_prefixes: Tuple[str, ...] = INVALIDATE_PREFIXES,
+    ):
+        self.minimum_size = minimum_size
+        self.cache = cache or ReferenceCache()
+        self.cacheable_routes = [re.compile(pattern) for pattern in cacheable_routes]
+        self.invalidate_prefixes = invalidate_prefixes
+
+    def is_cacheable(self, request: Request) -> bool:
+        if request.method != "GET":
+            return False
+        path = request.url.path
+        return any(pattern.match(path) for pattern in self.cacheable_routes)
+
+    def _build(
+        self,
+        status_code: int,
+        body: bytes,
+        encoding: Optional[str],
+        headers: List[Tuple[bytes, bytes]],
+    ) -> Response:
+        response = Response(content=body, status_code=status_code)
+        raw_headers = [
+            (name, value) for name, value in headers
+            if name not in (b"content-length", b"content-encoding", b"vary")
+        ]
+        raw_headers.append((b"content-length", str(len(body)).encode()))
+        raw_headers.append((b"vary", b"Accept-Encoding"))
+        if encoding is not None:
+            raw_headers.append((b"content-encoding", encoding.encode()))
+        response.raw_headers = raw_headers
+        return response
+
+    async def _respond_from_entry(self, entry: CacheEntry, encoding: Optional[str], headers=None) -> Response:
+        if len(entry.body) < self.minimum_size:
+            encoding = None
+        if headers is None:
+            headers = [(b"content-type", entry.media_type.encode())]
+        return self._build(200, await entry.get_body(encoding), encoding, headers)
+
+    async def __call__(self, request: Request, call_next):
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+        cacheable = self.is_cacheable(request)
+        cache_key = f"{request.url.path}?{request.url.query}"
+
+        if cacheable:
+            entry = self.cache.get(cache_key)
+            if entry is not None:
+                return await self._respond_from_entry(entry, encoding)
+            generation = self.cache.generation
+
+        response = await call_next(request)
+
+        if (
+            request.method not in ("GET", "HEAD")
+            and 200 <= response.status_code < 300
+            and request.url.path.startswith(self.invalidate_prefixes)
+        ):
+            self.cache.invalidate()
+
+        media_type = response.headers.get("content-type", "")
+        if request.method == "HEAD" or "content-encoding" in response.headers or not media_type.startswith(COMPRESSIBLE_TYPES):
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        if cacheable and response.status_code == 200:
+            entry = self.cache.put(cache_key, body, media_type, generation)
+            return await self._respond_from_entry(entry, encoding, response.raw_headers)
+
+        if len(body) < self.minimum_size:
+            encoding = None
+        if encoding is not None:
+            body = await compress(encoding, body)
+        return self._build(response.status_code, body, encoding, response.raw_headers)
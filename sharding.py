@@ -0,0 +1,107 @@
+# sharding.py
+#
+# Ixtiyoriy sharding: har bir region (va uning barcha district, school,
+# librarian, formular, transactionlari) alohida DB faylda saqlanadi.
+# Har bir shard o'z ID oralig'idan foydalanadi – shard k dagi barcha IDlar
+# [k * SHARD_ID_SPAN, (k + 1) * SHARD_ID_SPAN) ichida bo'ladi, shuning uchun
+# istalgan entity ID sidan uning shardini qo'shimcha so'rovsiz aniqlash mumkin.
+
+import asyncio
+import itertools
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+from sqlalchemy import MetaData, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.schema import CreateIndex
+
+SHARD_ID_SPAN = 10 ** 12
+
+T = TypeVar("T")
+
+
+class UnknownShard(Exception):
+    """ID hech qaysi shard oralig'iga tushmaydi."""
+
+
+async def create_schema(conn, metadata: MetaData):
+    """Create missing tables, and indexes that were added to already existing tables.
+
+    ``create_all`` only creates the indexes of tables it creates itself.
+    """
+    await conn.run_sync(metadata.create_all)
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            await conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+async def init_shard_schema(engine: AsyncEngine, shard: int, metadata: MetaData):
+    """Create the schema on a shard and reserve its id range.
+
+    Every AUTOINCREMENT table gets a ``sqlite_sequence`` row starting at
+    ``shard * SHARD_ID_SPAN`` unless the table already has one.
+    """
+    async with engine.begin() as conn:
+        await create_schema(conn, metadata)
+        for table in metadata.sorted_tables:
+            if not table.dialect_options["sqlite"].get("autoincrement"):
+                continue
+            await conn.execute(
+                text(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT :name, :start "
+                    "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"
+                ),
+                {"name": table.name, "start": shard * SHARD_ID_SPAN},
+            )
+
+
+class ShardRouter:
+    """Shard engine va sessionlarini boshqaradi, so'rovlarni kerakli shardga yo'naltiradi."""
+
+    def __init__(self, urls: List[str], sync_session_class=Session, echo: bool = False):
+        if not urls:
+            raise ValueError("At least one shard URL is required")
+        self.urls = urls
+        self.engines = [create_async_engine(url, echo=echo) for url in urls]
+        self.sessionmakers = [
+            sessionmaker(engine, expire_on_commit=False, class_=AsyncSession, sync_session_class=sync_session_class)
+            for engine in self.engines
+        ]
+        self._region_shards = itertools.cycle(range(len(urls)))
+
+    def __len__(self):
+        return len(self.engines)
+
+    def shard_for_id(self, entity_id: int) -> int:
+        shard = entity_id // SHARD_ID_SPAN
+        if entity_id < 0 or shard >= len(self.engines):
+            raise UnknownShard(entity_id)
+        return shard
+
+    def next_region_shard(self) -> int:
+        # Yangi regionlar shardlar bo'yicha navbatma-navbat taqsimlanadi
+        return next(self._region_shards)
+
+    async def create_all(self, metadata: MetaData):
+        await asyncio.gather(*(
+            init_shard_schema(engine, shard, metadata) for shard, engine in enumerate(self.engines)
+        ))
+
+    async def gather(self, fn: Callable[[AsyncSession], Awaitable[T]], shards: Optional[List[int]] = None) -> List[T]:
+        """Run ``fn(session)`` on every shard concurrently; results are in shard order."""
+
+        async def run(shard: int):
+            async with self.sessionmakers[shard]() as session:
+                return await fn(session)
+
+        targets = range(len(self.engines)) if shards is None else shards
+        return await asyncio.gather(*(run(shard) for shard in targets))
+
+    async def fetch_all(self, statement, params=None) -> list:
+        async def fetch(session: AsyncSession):
+            return (await session.execute(statement, params)).fetchall()
+
+        return [row for rows in await self.gather(fetch) for row in rows]
+
+    async def dispose(self):
+        await asyncio.gather(*(engine.dispose() for engine in self.engines))
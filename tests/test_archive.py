@@ -0,0 +1,127 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+import httpx
+import pytest
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import main
+
+NOW = datetime.now()
+
+
+def transaction(id, formular_id=1, returned_days_ago=None):
+    return {
+        "id": id,
+        "formular_id": formular_id,
+        "kitob_qaytarish_muddati": date(2020, 1, 1),
+        "kitob_olingan_sana": NOW - timedelta(days=1000),
+        "kitob_qaytarilgan_sana": None if returned_days_ago is None else NOW - timedelta(days=returned_days_ago),
+        "inventar_raqami": f"INV-{id}",
+        "bolim": "Badiiy",
+        "muallif": "Muallif",
+        "kitob_nomi": "Kitob",
+        "is_returned": returned_days_ago is not None,
+        "created_at": NOW,
+        "updated_at": NOW,
+    }
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'archive.db'}")
+    session_factory = sessionmaker(
+        engine, expire_on_commit=False, class_=AsyncSession, sync_session_class=main.ChangeTrackingSession
+    )
+
+    async def create_schema():
+        async with engine.begin() as conn:
+            await conn.run_sync(main.Base.metadata.create_all)
+
+    asyncio.run(create_schema())
+    monkeypatch.setattr(main, "engine", engine)
+    monkeypatch.setattr(main, "async_session", session_factory)
+    monkeypatch.setattr(main.rate_limiter, "enabled", False)
+    yield engine
+    asyncio.run(engine.dispose())
+
+
+async def load(engine, rows):
+    async with engine.begin() as conn:
+        await conn.execute(insert(main.BookTransaction.__table__), rows)
+
+
+async def table_ids(engine):
+    async with engine.connect() as conn:
+        tables = ["booktransactions"] + await main.get_archive_tables(conn)
+        return {
+            table: sorted((await conn.execute(text(f"SELECT id FROM {table}"))).scalars().all())
+            for table in tables
+        }
+
+
+def year_of(days_ago):
+    return (NOW - timedelta(days=days_ago)).strftime("%Y")
+
+
+def test_old_returns_move_to_their_year_table(engine):
+    rows = [
+        transaction(1, returned_days_ago=400),
+        transaction(2, returned_days_ago=800),
+        transaction(3),  # ochiq
+        transaction(4, returned_days_ago=10),  # yaqinda qaytarilgan
+        transaction(5, returned_days_ago=401),
+    ]
+
+    async def run():
+        await load(engine, rows)
+        archived = await main.archive_returned_transactions(older_than_days=180, batch_size=100, db_engine=engine)
+        return archived, await table_ids(engine)
+
+    archived, tables = asyncio.run(run())
+    assert archived == 3
+    assert tables.pop("booktransactions") == [3, 4]
+    expected = {}
+    for id, days_ago in ((1, 400), (2, 800), (5, 401)):
+        expected.setdefault("booktransactions_archive_" + year_of(days_ago), []).append(id)
+    assert tables == expected
+
+
+def test_batches_continue_after_the_last_archived_id(engine):
+    # Arxivlanadigan va qoladigan qatorlar aralash – har partiya oldingisidan keyin davom etadi
+    rows = [transaction(id, returned_days_ago=400 if id % 3 else None) for id in range(1, 31)]
+
+    async def run():
+        await load(engine, rows)
+        archived = await main.archive_returned_transactions(older_than_days=180, batch_size=4, db_engine=engine)
+        again = await main.archive_returned_transactions(older_than_days=180, batch_size=4, db_engine=engine)
+        return archived, again, await table_ids(engine)
+
+    archived, again, tables = asyncio.run(run())
+    assert archived == 20
+    assert again == 0
+    assert tables["booktransactions"] == list(range(3, 31, 3))
+    assert tables["booktransactions_archive_" + year_of(400)] == [id for id in range(1, 31) if id % 3]
+
+
+def test_formular_transactions_include_archived_on_request(engine):
+    rows = [
+        transaction(1, formular_id=1, returned_days_ago=400),
+        transaction(2, formular_id=1),
+        transaction(3, formular_id=2, returned_days_ago=400),
+    ]
+
+    async def run():
+        await load(engine, rows)
+        await main.archive_returned_transactions(older_than_days=180, db_engine=engine)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            hot = await client.get("/formulars/1/transactions")
+            full = await client.get("/formulars/1/transactions?include_archived=true")
+        return hot.json(), full.json()
+
+    hot, full = asyncio.run(run())
+    assert [row["id"] for row in hot] == [2]
+    assert sorted(row["id"] for row in full) == [1, 2]
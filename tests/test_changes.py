@@ -0,0 +1,148 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from sqlalchemy import event, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import main
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'changes.db'}")
+    session_factory = sessionmaker(
+        engine, expire_on_commit=False, class_=AsyncSession, sync_session_class=main.ChangeTrackingSession
+    )
+
+    async def create_schema():
+        async with engine.begin() as conn:
+            await conn.run_sync(main.Base.metadata.create_all)
+
+    asyncio.run(create_schema())
+    monkeypatch.setattr(main, "async_session", session_factory)
+    monkeypatch.setattr(main.rate_limiter, "enabled", False)
+    yield engine, session_factory
+    asyncio.run(engine.dispose())
+
+
+async def change_rows(engine):
+    async with engine.connect() as conn:
+        result = await conn.execute(select(main.Change.entity, main.Change.entity_id, main.Change.op).order_by(main.Change.seq))
+        return [tuple(row) for row in result]
+
+
+def test_each_write_records_exactly_one_change(db):
+    engine, _ = db
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            region = (await client.post("/regions", json={"name": "Toshkent"})).json()
+            after_create = await change_rows(engine)
+            await client.put(f"/regions/{region['id']}", json={"name": "Samarqand"})
+            after_update = await change_rows(engine)
+            await client.delete(f"/regions/{region['id']}")
+            return region["id"], after_create, after_update, await change_rows(engine)
+
+    region_id, after_create, after_update, after_delete = asyncio.run(run())
+    assert after_create == [("regions", region_id, "create")]
+    assert after_update == after_create + [("regions", region_id, "update")]
+    assert after_delete == after_update + [("regions", region_id, "delete")]
+
+
+def test_change_row_commits_with_the_write(db):
+    engine, session_factory = db
+
+    async def run():
+        async with session_factory() as session:
+            session.add(main.Region(name="Buxoro"))
+            await session.flush()
+            # Yozuv va change qatori bir tranzaksiyada – commitgacha tashqaridan ko'rinmaydi
+            before_commit = await change_rows(engine)
+            await session.commit()
+        return before_commit, await change_rows(engine)
+
+    before_commit, after_commit = asyncio.run(run())
+    assert before_commit == []
+    assert [op for _, _, op in after_commit] == ["create"]
+
+
+def test_rollback_writes_no_change_and_notifies_nobody(db, monkeypatch):
+    engine, session_factory = db
+    # Poller uxlab turadi – faqat shu worker commitlari uyg'otishi mumkin
+    watcher = main.ChangeWatcher(engine, interval=60)
+    monkeypatch.setitem(main._change_watchers, engine, watcher)
+
+    async def run():
+        wait = asyncio.create_task(watcher.wait(watcher.seq, 0.2))
+        await asyncio.sleep(0)
+        async with session_factory() as session:
+            session.add(main.Region(name="Xiva"))
+            await session.flush()
+            await session.rollback()
+        async with engine.connect() as conn:
+            regions = (await conn.execute(select(main.Region.id))).all()
+        return regions, await change_rows(engine), await wait
+
+    regions, changes, notified = asyncio.run(run())
+    assert regions == []
+    assert changes == []
+    assert not notified
+
+
+def test_idle_long_polls_share_one_poller(db, monkeypatch):
+    engine, _ = db
+    monkeypatch.setattr(main, "CHANGES_POLL_INTERVAL", 0.05)
+    max_queries = []
+
+    def count_max_queries(conn, cursor, statement, parameters, context, executemany):
+        if "max(changes.seq)" in statement:
+            max_queries.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count_max_queries)
+
+    async def other_worker_writes():
+        # Boshqa worker yozuvi: bu workerdagi commit hodisasi ishlamaydi
+        await asyncio.sleep(0.3)
+        async with engine.begin() as conn:
+            await conn.execute(insert(main.Change.__table__).values(entity="regions", entity_id=1, op="create", school_id=7))
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            polls = [client.get("/changes?school_id=7&wait=10") for _ in range(20)]
+            started = time.monotonic()
+            responses = await asyncio.gather(*polls, other_worker_writes())
+            return responses[:-1], time.monotonic() - started
+
+    responses, elapsed = asyncio.run(run())
+    assert elapsed < 5
+    assert all(len(response.json()["changes"]) == 1 for response in responses)
+    assert len(max_queries) < 20
+
+
+def test_startup_upgrades_an_existing_database(db, monkeypatch):
+    engine, _ = db
+    monkeypatch.setattr(main, "engine", engine)
+
+    async def run():
+        # Eski sxema: changes jadvali va keyin qo'shilgan indekslar yo'q
+        async with engine.begin() as conn:
+            await conn.exec_driver_sql("DROP TABLE changes")
+            await conn.exec_driver_sql("DROP INDEX ix_booktransactions_formular_id")
+            await conn.exec_driver_sql("DROP INDEX ix_formulars_school_id")
+        async with main.app.router.lifespan_context(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                created = await client.post("/regions", json={"name": "Navoiy"})
+        async with engine.connect() as conn:
+            indexes = (await conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars().all()
+        return created, await change_rows(engine), indexes
+
+    created, changes, indexes = asyncio.run(run())
+    assert created.status_code == 200
+    assert changes == [("regions", created.json()["id"], "create")]
+    assert {"ix_booktransactions_formular_id", "ix_formulars_school_id", "ix_changes_school_id_seq"} <= set(indexes)
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+from jobs import JobManager
+
+
+def write_rows(release):
+    async def runner(job, path):
+        await release.wait()
+        with open(path, "w") as f:
+            f.write("id\n1\n")
+        job.rows_done = 1
+
+    return runner
+
+
+async def wait_finished(manager, job_id):
+    while (job := await manager.get(job_id)).status not in ("done", "failed"):
+        await asyncio.sleep(0.01)
+    return job
+
+
+def test_job_state_is_shared_between_workers(tmp_path):
+    # Ikki JobManager bitta katalogda – bir hostdagi ikki worker kabi
+    first = JobManager(str(tmp_path), heartbeat_interval=0.01)
+    second = JobManager(str(tmp_path), heartbeat_interval=0.01)
+
+    async def run():
+        release = asyncio.Event()
+        job = await first.submit("export", {"school_id": 1}, write_rows(release))
+        duplicate = await second.submit("export", {"school_id": 1}, write_rows(release))
+        seen = await second.get(job.id)
+        release.set()
+        return job, duplicate, seen, await wait_finished(second, job.id)
+
+    job, duplicate, seen, finished = asyncio.run(run())
+    assert duplicate.id == job.id
+    assert seen.status in ("queued", "running")
+    assert finished.status == "done"
+    assert finished.rows_done == 1
+    assert open(finished.result_path).read() == "id\n1\n"
+
+
+def test_concurrency_cap_applies_across_workers(tmp_path):
+    first = JobManager(str(tmp_path), max_concurrent=1, heartbeat_interval=0.01)
+    second = JobManager(str(tmp_path), max_concurrent=1, heartbeat_interval=0.01)
+
+    async def run():
+        release = asyncio.Event()
+        a = await first.submit("export", {"school_id": 1}, write_rows(release))
+        b = await second.submit("export", {"school_id": 2}, write_rows(release))
+        await asyncio.sleep(0.2)
+        statuses = [(await first.get(a.id)).status, (await first.get(b.id)).status]
+        release.set()
+        await wait_finished(first, a.id)
+        await wait_finished(first, b.id)
+        return statuses
+
+    assert asyncio.run(run()) == ["running", "queued"]
+
+
+def test_jobs_of_a_stopped_worker_are_marked_failed(tmp_path):
+    manager = JobManager(str(tmp_path), stale_after=5)
+
+    def insert_abandoned(conn):
+        stale = time.time() - 60
+        conn.execute(
+            "INSERT INTO jobs (id, kind, params, key, status, rows_done, created_at, heartbeat_at) "
+            "VALUES ('lost', 'export', '{}', 'export:{}', 'running', 10, ?, ?)",
+            (stale, stale),
+        )
+
+    async def run():
+        await manager._db(insert_abandoned)
+        # Yangi job qo'shilganda eski heartbeatli joblar tozalanadi
+        await manager.submit("export", {}, write_rows(asyncio.Event()))
+        return await manager.get("lost")
+
+    lost = asyncio.run(run())
+    assert lost.status == "failed"
+    assert lost.error == "Worker stopped"
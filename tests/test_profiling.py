@@ -0,0 +1,35 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+
+from profiling import ProfiledRoute, ProfilingMiddleware, waiting
+
+
+def test_long_poll_wait_does_not_count_as_slow():
+    profiler = ProfilingMiddleware(threshold_ms=100)
+    app = FastAPI()
+    app.router.route_class = ProfiledRoute
+
+    @app.get("/poll")
+    async def poll():
+        with waiting():
+            await asyncio.sleep(0.3)
+        return {"ok": True}
+
+    @app.get("/slow")
+    async def slow():
+        await asyncio.sleep(0.3)
+        return {"ok": True}
+
+    app.middleware("http")(profiler)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.get("/poll")
+            await client.get("/slow")
+
+    asyncio.run(run())
+    assert [trace["path"] for trace in profiler.slow] == ["/slow"]
+    assert "idle" not in profiler.slow[0]["phases"]
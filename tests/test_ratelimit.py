@@ -0,0 +1,136 @@
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from ratelimit import RateLimiter, SQLiteBackend
+
+
+def make_client(limiter, app=None):
+    app = app or FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    app.middleware("http")(limiter)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+async def get_many(client, n, headers=None):
+    return [(await client.get("/ping", headers=headers)) for _ in range(n)]
+
+
+def test_bucket_exhaustion_returns_429_with_retry_after():
+    limiter = RateLimiter(rate=1, burst=3)
+
+    async def run():
+        async with make_client(limiter) as client:
+            return await get_many(client, 4)
+
+    responses = asyncio.run(run())
+    assert [r.status_code for r in responses] == [200, 200, 200, 429]
+    assert int(responses[-1].headers["Retry-After"]) >= 1
+
+
+def test_unknown_api_keys_share_the_ip_bucket():
+    limiter = RateLimiter(rate=1, burst=2, api_keys=["known"])
+
+    async def run():
+        async with make_client(limiter) as client:
+            rotating = [(await client.get("/ping", headers={"X-API-Key": f"random-{i}"})) for i in range(3)]
+            known = await get_many(client, 2, headers={"X-API-Key": "known"})
+            return rotating, known
+
+    rotating, known = asyncio.run(run())
+    assert [r.status_code for r in rotating] == [200, 200, 429]
+    assert [r.status_code for r in known] == [200, 200]
+
+
+def test_full_in_flight_budget_returns_503():
+    limiter = RateLimiter(rate=100, burst=100, max_in_flight=1)
+    app = FastAPI()
+    entered, release = asyncio.Event(), asyncio.Event()
+
+    @app.get("/slow")
+    async def slow():
+        entered.set()
+        await release.wait()
+        return {"ok": True}
+
+    async def run():
+        async with make_client(limiter, app) as client:
+            first = asyncio.create_task(client.get("/slow"))
+            await entered.wait()
+            rejected = await client.get("/ping")
+            release.set()
+            return await first, rejected
+
+    first, rejected = asyncio.run(run())
+    assert first.status_code == 200
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "1"
+
+
+def test_requests_shed_with_503_do_not_spend_tokens():
+    limiter = RateLimiter(rate=0.001, burst=2, max_in_flight=1)
+    app = FastAPI()
+    entered, release = asyncio.Event(), asyncio.Event()
+
+    @app.get("/slow")
+    async def slow():
+        entered.set()
+        await release.wait()
+        return {"ok": True}
+
+    async def run():
+        async with make_client(limiter, app) as client:
+            first = asyncio.create_task(client.get("/slow"))
+            await entered.wait()
+            shed = await get_many(client, 3)
+            release.set()
+            await first
+            # Rad etilgan so'rovlar tokenni olmagan – qayta urinish o'tadi
+            return shed, await get_many(client, 2)
+
+    shed, retried = asyncio.run(run())
+    assert [r.status_code for r in shed] == [503, 503, 503]
+    assert [r.status_code for r in retried] == [200, 429]
+
+
+def test_long_polls_do_not_use_the_shared_in_flight_budget():
+    limiter = RateLimiter(rate=100, burst=100, max_in_flight=2, max_long_poll_in_flight=3)
+    app = FastAPI()
+    release = asyncio.Event()
+    waiting = []
+
+    @app.get("/changes")
+    async def changes(wait: int = 0):
+        waiting.append(wait)
+        await release.wait()
+        return {"ok": True}
+
+    async def run():
+        async with make_client(limiter, app) as client:
+            polls = [asyncio.create_task(client.get("/changes?wait=30")) for _ in range(4)]
+            while len(waiting) < 3:
+                await asyncio.sleep(0.01)
+            others = await get_many(client, 2)
+            overflow = await polls[3]
+            release.set()
+            return [await poll for poll in polls[:3]], others, overflow
+
+    polls, others, overflow = asyncio.run(run())
+    assert [r.status_code for r in others] == [200, 200]
+    assert [r.status_code for r in polls] == [200, 200, 200]
+    assert overflow.status_code == 503
+
+
+def test_sqlite_backend_prunes_stale_buckets(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "buckets.db"), stale_after=10, prune_interval=0)
+    asyncio.run(backend.take("old", rate=1, burst=5))
+    backend._conn.execute("UPDATE rate_buckets SET updated_at = ?", (time.time() - 60,))
+    asyncio.run(backend.take("new", rate=1, burst=5))
+    keys = [row[0] for row in backend._conn.execute("SELECT key FROM rate_buckets")]
+    assert keys == ["new"]
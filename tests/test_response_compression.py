@@ -0,0 +1,103 @@
+import asyncio
+import gzip
+
+import httpx
+from fastapi import FastAPI
+
+import response_compression
+from response_compression import CompressionMiddleware, choose_encoding
+
+
+def test_choose_encoding_respects_q_values():
+    assert choose_encoding("gzip") == "gzip"
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("*;q=0.5, gzip;q=0") not in (None, "gzip")
+    assert choose_encoding("identity") is None
+    assert choose_encoding("") is None
+
+
+def make_app(middleware, names):
+    app = FastAPI()
+
+    @app.get("/regions")
+    async def list_regions():
+        return [{"id": i, "name": name} for i, name in enumerate(names)]
+
+    @app.post("/regions")
+    async def create_region():
+        names.append("new region")
+        return {"id": len(names)}
+
+    app.middleware("http")(middleware)
+    return app
+
+
+def test_writes_invalidate_the_reference_cache():
+    names = [f"region number {i}" for i in range(100)]
+    middleware = CompressionMiddleware(minimum_size=1024)
+
+    async def run():
+        app = make_app(middleware, names)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            first = await client.get("/regions", headers={"Accept-Encoding": "gzip"})
+            names.append("added behind the cache")
+            cached = await client.get("/regions", headers={"Accept-Encoding": "gzip"})
+            await client.post("/regions")
+            fresh = await client.get("/regions", headers={"Accept-Encoding": "gzip"})
+            return first, cached, fresh
+
+    first, cached, fresh = asyncio.run(run())
+    assert first.headers["content-encoding"] == "gzip"
+    assert len(cached.json()) == 100
+    assert len(fresh.json()) == 102
+
+
+def test_slow_read_overlapping_a_write_is_not_cached():
+    names = ["a"]
+    read, release = asyncio.Event(), asyncio.Event()
+    middleware = CompressionMiddleware(minimum_size=1024)
+    app = FastAPI()
+
+    @app.get("/regions")
+    async def list_regions():
+        snapshot = list(names)
+        read.set()
+        await release.wait()
+        return snapshot
+
+    @app.post("/regions")
+    async def create_region():
+        names.append("b")
+        return {"id": len(names)}
+
+    app.middleware("http")(middleware)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            # GET yozuvdan oldin o'qiydi, lekin keshga yozuv tugagandan keyin yetib keladi
+            slow = asyncio.create_task(client.get("/regions"))
+            await read.wait()
+            await client.post("/regions")
+            release.set()
+            stale = await slow
+            return stale, await client.get("/regions")
+
+    stale, fresh = asyncio.run(run())
+    assert stale.json() == ["a"]
+    assert fresh.json() == ["a", "b"]
+
+
+def test_large_bodies_are_compressed_off_the_event_loop(monkeypatch):
+    monkeypatch.setattr(response_compression, "THREAD_COMPRESS_SIZE", 1024)
+    calls = []
+    real_to_thread = asyncio.to_thread
+
+    async def to_thread(func, *args):
+        calls.append(func)
+        return await real_to_thread(func, *args)
+
+    monkeypatch.setattr(response_compression.asyncio, "to_thread", to_thread)
+    body = b"x" * 4096
+    compressed = asyncio.run(response_compression.compress("gzip", body))
+    assert gzip.decompress(compressed) == body
+    assert calls
@@ -0,0 +1,49 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+from sharding import SHARD_ID_SPAN, ShardRouter
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    router = ShardRouter(
+        [f"sqlite+aiosqlite:///{tmp_path / f'shard{shard}.db'}" for shard in range(2)],
+        sync_session_class=main.ChangeTrackingSession,
+    )
+    asyncio.run(router.create_all(main.Base.metadata))
+    monkeypatch.setattr(main, "shard_router", router)
+    monkeypatch.setattr(main.rate_limiter, "enabled", False)
+
+    async def request(method, url, **kwargs):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, url, **kwargs)
+
+    yield lambda method, url, **kwargs: asyncio.run(request(method, url, **kwargs))
+    asyncio.run(router.dispose())
+
+
+def test_new_regions_are_assigned_round_robin(client):
+    regions = [client("POST", "/regions", json={"name": f"Region {i}"}).json() for i in range(4)]
+    assert [region["id"] // SHARD_ID_SPAN for region in regions] == [0, 1, 0, 1]
+
+    # Bolalar ota regionining shardida yaratiladi
+    district = client("POST", f"/regions/{regions[1]['id']}/districts", json={"name": "D", "region_id": regions[1]["id"]})
+    assert district.status_code == 200
+    assert district.json()["id"] // SHARD_ID_SPAN == 1
+
+
+def test_cross_shard_ids_return_400(client):
+    first, second = (client("POST", "/regions", json={"name": f"Region {i}"}).json() for i in range(2))
+    response = client("POST", f"/regions/{first['id']}/districts", json={"name": "D", "region_id": second["id"]})
+    assert response.status_code == 400
+    assert client("GET", "/districts").json() == []
+
+
+def test_id_outside_every_shard_returns_404(client):
+    response = client("GET", f"/regions/{2 * SHARD_ID_SPAN + 1}")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Shard not found"